@@ -1,9 +1,9 @@
 from urllib import response
-from flask import Flask, Response, jsonify, request
+from flask import Flask, Response, jsonify, request, send_file
 from flask_cors import CORS
 import cv2
 import threading
-from typing import Dict
+from typing import Dict, List
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import psycopg2.pool
@@ -23,14 +23,25 @@ import json
 import tensorflow as tf
 from flask_cors import CORS
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.schema.messages import SystemMessage
+from langchain.schema.messages import SystemMessage, HumanMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_google_genai import ChatGoogleGenerativeAI
+import itertools
+import heapq
+import struct
+import hashlib
 import queue
+import random
+import asyncio
+from collections import deque, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, TimeoutError as FuturesTimeoutError
+from concurrent.futures import wait as wait_futures
 from functools import lru_cache
 import warnings
+import re
+from abc import ABC, abstractmethod
 warnings.filterwarnings("ignore", category=UserWarning, module="mediapipe")
 
 app = Flask(__name__)
@@ -71,6 +82,9 @@ except Exception as e:
 # Add global variables to store recent events
 recent_events = []
 events_lock = threading.Lock()
+events_condition = threading.Condition(events_lock)
+event_counter = itertools.count(1)
+event_listeners = set()  # (event loop, asyncio.Event) of async event streams, woken by add_event
 
 def get_db_connection():
     """Get a database connection from the pool"""
@@ -103,6 +117,16 @@ hands_processor = mp_hands.Hands(
 # Global state to track active models
 active_models = {}
 
+# Most recent model result per camera and model type, pushed alongside WebSocket frames
+latest_detections: Dict[str, dict] = {}
+
+def record_detection(camera_id: str, model_type: str, result):
+    # /model-control may pass a JSON int; streams (and so the WebSocket header) use str ids
+    latest_detections.setdefault(str(camera_id), {})[model_type] = {
+        'result': result,
+        'timestamp': datetime.now().isoformat()
+    }
+
 def fix_base64_padding(encoded_str: str) -> str:
     """Add padding to base64 string if needed."""
     padding = len(encoded_str) % 4
@@ -124,7 +148,410 @@ def safe_base64_decode(encoded_str: str) -> bytes:
             logger.error(f"Failed to decode base64 string: {str(e)}")
             raise
 
-class Assistant:
+# Remote verdicts are reused while a camera's frame looks the same (dHash within distance)
+INFERENCE_CACHE_TTL = float(os.getenv("INFERENCE_CACHE_TTL", "30"))
+INFERENCE_CACHE_SIZE = 512
+INFERENCE_CACHE_MAX_DISTANCE = int(os.getenv("INFERENCE_CACHE_MAX_DISTANCE", "4"))  # Of 64 hash bits
+# A fire that starts small in a corner never flips the hash, so fire answers are only
+# reused for identical hashes and only for a few seconds
+INFERENCE_CACHE_OVERRIDES = {
+    'fire': {'ttl': float(os.getenv("INFERENCE_CACHE_TTL_FIRE", "5")), 'max_distance': 0},
+}
+
+def frame_dhash(frame) -> int:
+    """64-bit difference hash of a frame: signs of horizontal gradients on a 9x8 grayscale"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+class InferenceResultCache:
+    """LRU + TTL cache of model answers keyed by (model type, prompt, camera, backend) and a frame dHash"""
+
+    def __init__(self, ttl: float = INFERENCE_CACHE_TTL, max_entries: int = INFERENCE_CACHE_SIZE,
+                 max_distance: int = INFERENCE_CACHE_MAX_DISTANCE, overrides: Dict[str, dict] = INFERENCE_CACHE_OVERRIDES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.overrides = overrides  # model type -> {'ttl', 'max_distance'}
+        self.entries = OrderedDict()  # (model type, prompt, camera id, backend, hash) -> (answer, time)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def get(self, model_type: str, prompt: str, camera_id, backend: str, frame_hash: int):
+        """Cached answer for an identical or near-identical frame, or None"""
+        now = time.time()
+        max_distance = self.overrides.get(model_type, {}).get('max_distance', self.max_distance)
+        with self.lock:
+            exact = (model_type, prompt, camera_id, backend, frame_hash)
+            best_key, best_distance = None, max_distance + 1
+            for key, (answer, stored_at) in list(self.entries.items()):
+                if now - stored_at > self.overrides.get(key[0], {}).get('ttl', self.ttl):
+                    del self.entries[key]
+                    continue
+                if key[:4] != exact[:4]:
+                    continue
+                distance = bin(key[4] ^ frame_hash).count('1')
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+
+            if best_key is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(best_key)
+            if best_distance:
+                self.near_hits += 1
+            else:
+                self.hits += 1
+            return self.entries[best_key][0]
+
+    def put(self, model_type: str, prompt: str, camera_id, backend: str, frame_hash: int, answer: str):
+        key = (model_type, prompt, camera_id, backend, frame_hash)
+        with self.lock:
+            self.entries[key] = (answer, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'near_hits': self.near_hits,
+                'misses': self.misses,
+                'hit_ratio': round((self.hits + self.near_hits) / lookups, 3) if lookups else 0.0
+            }
+
+# Requests for the same model and prompt from different cameras that arrive within
+# the window are sent as one multi-image request (0 disables batching)
+INFERENCE_BATCH_WINDOW = float(os.getenv("INFERENCE_BATCH_WINDOW", "0.25"))
+INFERENCE_BATCH_MAX = int(os.getenv("INFERENCE_BATCH_MAX", "4"))
+
+# Remote model calls: at most ASSISTANT_MAX_CONCURRENCY in flight, each (camera, model)
+# limited by its own token bucket, and queued calls dropped once their deadline passes
+ASSISTANT_MAX_CONCURRENCY = int(os.getenv("ASSISTANT_MAX_CONCURRENCY", "4"))
+ASSISTANT_RATE_PER_CAMERA = float(os.getenv("ASSISTANT_RATE_PER_CAMERA", "1.0"))  # Calls per second
+ASSISTANT_BURST_PER_CAMERA = float(os.getenv("ASSISTANT_BURST_PER_CAMERA", "2"))
+ASSISTANT_REQUEST_DEADLINE = float(os.getenv("ASSISTANT_REQUEST_DEADLINE", "10"))  # Seconds for a call, queueing included
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def try_take(self) -> bool:
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+# Per-model circuit breaker: after BREAKER_FAILURE_THRESHOLD consecutive failures calls
+# fail fast for BREAKER_OPEN_SECONDS, then a single probe decides whether to close again
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_MAX_OPEN_SECONDS = float(os.getenv("BREAKER_MAX_OPEN_SECONDS", "300"))
+BREAKER_DEGRADED_INTERVAL_FACTOR = float(os.getenv("BREAKER_DEGRADED_INTERVAL_FACTOR", "4"))  # Slower sampling while open
+
+class CircuitBreaker:
+    """closed -> open after repeated failures -> half-open (one probe) -> closed or open again"""
+
+    def __init__(self, model_type: str):
+        self.model_type = model_type
+        self.state = 'closed'
+        self.failures = 0
+        self.open_seconds = BREAKER_OPEN_SECONDS
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.short_circuited = 0
+        self.trips = 0
+        self.last_error = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """None to skip the call, else how it was let through ('closed' or 'probe'); pass that back
+        to record_success/record_failure"""
+        with self.lock:
+            if self.state == 'closed':
+                return 'closed'
+            if self.state == 'open' and time.time() - self.opened_at >= self.open_seconds:
+                self.state = 'half-open'
+            if self.state == 'half-open' and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return 'probe'
+            self.short_circuited += 1
+            return None
+
+    def record_success(self, admitted: str = 'closed'):
+        with self.lock:
+            if admitted != 'probe' and self.state != 'closed':
+                return  # A call sent before the breaker opened says nothing about the endpoint now
+            if self.state != 'closed':
+                logger.info(f"✅ {self.model_type} model recovered, closing circuit breaker")
+            self.state = 'closed'
+            self.failures = 0
+            self.open_seconds = BREAKER_OPEN_SECONDS
+            self.probe_in_flight = False
+
+    def record_failure(self, error: Exception, admitted: str = 'closed'):
+        with self.lock:
+            self.last_error = str(error)
+            if admitted != 'probe' and self.state != 'closed':
+                return  # Stragglers from before the trip must not re-open or extend it
+            self.failures += 1
+            if admitted == 'probe':
+                # Failed probe: stay away longer each time the endpoint is still down
+                self.open_seconds = min(self.open_seconds * 2, BREAKER_MAX_OPEN_SECONDS)
+            elif self.failures < BREAKER_FAILURE_THRESHOLD:
+                return
+            self.state = 'open'
+            self.opened_at = time.time()
+            self.probe_in_flight = False
+            self.trips += 1
+            logger.warning(f"⚠️ {self.model_type} model circuit open for {self.open_seconds:.0f}s after {self.failures} failures: {error}")
+
+    def is_open(self) -> bool:
+        return self.state != 'closed'
+
+    def stats(self) -> dict:
+        with self.lock:
+            retry_in = self.opened_at + self.open_seconds - time.time() if self.state == 'open' else 0.0
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'open_seconds': self.open_seconds,
+                'retry_in_s': round(max(retry_in, 0.0), 1),
+                'trips': self.trips,
+                'short_circuited': self.short_circuited,
+                'last_error': self.last_error
+            }
+
+class InferenceExecutor:
+    """Bounded worker pool for remote model calls; queued calls start earliest deadline first"""
+
+    def __init__(self, max_workers: int = ASSISTANT_MAX_CONCURRENCY):
+        self.max_workers = max_workers
+        self.queue = []  # Heap of (deadline, order, fn, future)
+        self.order = itertools.count()
+        self.condition = threading.Condition()
+        self.threads = []
+        self.running = 0
+        self.completed = 0
+        self.expired = 0
+
+    def submit(self, fn, deadline: float) -> Future:
+        """Run fn() on a worker unless deadline passes first; the future then raises TimeoutError"""
+        future = Future()
+        with self.condition:
+            heapq.heappush(self.queue, (deadline, next(self.order), fn, future))
+            if len(self.threads) < self.max_workers:
+                thread = threading.Thread(target=self._worker, daemon=True)
+                self.threads.append(thread)
+                thread.start()
+            self.condition.notify()
+        return future
+
+    def _worker(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.queue)
+                deadline, _, fn, future = heapq.heappop(self.queue)
+                if time.time() > deadline:
+                    self.expired += 1
+                    future.set_exception(TimeoutError("Deadline passed before the request was sent"))
+                    continue
+                self.running += 1
+            try:
+                if future.set_running_or_notify_cancel():
+                    future.set_result(fn())
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self.condition:
+                    self.running -= 1
+                    self.completed += 1
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {
+                'max_concurrency': self.max_workers,
+                'running': self.running,
+                'queued': len(self.queue),
+                'completed': self.completed,
+                'expired': self.expired
+            }
+
+class BatchReplyError(ValueError):
+    """The model answered a multi-image request, but not with one answer per image"""
+
+def parse_batch_verdicts(text: str, count: int) -> List[str]:
+    """Per-image answers from a multi-image reply that should be a JSON array of strings"""
+    start, end = text.find('['), text.rfind(']')
+    if start < 0 or end < start:
+        raise BatchReplyError("No JSON array in batch reply")
+    try:
+        verdicts = json.loads(text[start:end + 1])
+    except ValueError as e:
+        raise BatchReplyError(f"Unparseable batch reply: {e}")
+    if not isinstance(verdicts, list) or len(verdicts) != count:
+        raise BatchReplyError(f"Expected {count} verdicts, got {verdicts!r}")
+    return [str(verdict).strip() for verdict in verdicts]
+
+class InferenceBatcher:
+    """Groups concurrent requests for the same model and prompt into one multi-image call.
+
+    The first caller of a batch waits out the window and then queues it on the
+    executor; later callers just wait on their future. A full batch is queued right
+    away by the caller that filled it.
+    """
+
+    def __init__(self, assistant: 'Assistant', window: float = INFERENCE_BATCH_WINDOW,
+                 max_size: int = INFERENCE_BATCH_MAX):
+        self.assistant = assistant
+        self.window = window
+        self.max_size = max_size
+        self.pending: Dict[tuple, list] = {}  # (backend, model type, prompt) -> [(item, future)]
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.batched_images = 0
+        self.fallbacks = 0
+
+    def submit(self, backend: 'InferenceBackend', model_type: str, prompt: str, item: tuple, deadline: float) -> Future:
+        """Future answer for one (image, frame) item, possibly sent together with other cameras' items"""
+        key = (backend.key, model_type, prompt)
+        future = Future()
+        with self.lock:
+            batch = self.pending.get(key)
+            leader = batch is None
+            if leader:
+                batch = self.pending[key] = []
+            batch.append((item, future))
+            full = len(batch) >= self.max_size
+            if full:
+                del self.pending[key]
+
+        if full:
+            self._queue(backend, model_type, prompt, batch, deadline)
+        elif leader:
+            time.sleep(self.window)
+            with self.lock:
+                mine = self.pending.get(key) is batch
+                if mine:
+                    del self.pending[key]
+            if mine:
+                self._queue(backend, model_type, prompt, batch, deadline)
+        return future
+
+    def _queue(self, backend: 'InferenceBackend', model_type: str, prompt: str, batch: list, deadline: float):
+        sent = self.assistant.executor.submit(lambda: self._send(backend, model_type, prompt, batch), deadline)
+
+        def fail_unanswered(sent):
+            # The batch expired in the queue (or crashed): release everyone waiting on it
+            if sent.exception():
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(sent.exception())
+        sent.add_done_callback(fail_unanswered)
+
+    def _send(self, backend: 'InferenceBackend', model_type: str, prompt: str, batch: list):
+        items = [item for item, _ in batch]
+        self.requests += 1
+        if len(batch) > 1:
+            try:
+                verdicts = backend.infer_many(model_type, prompt, items)
+                self.batches += 1
+                self.batched_images += len(batch)
+                for (_, future), verdict in zip(batch, verdicts):
+                    future.set_result(verdict)
+                return
+            except BatchReplyError as e:
+                # A reply that cannot be split per image is retried one image at a time
+                logger.warning(f"⚠️ Batched {model_type} reply for {len(batch)} images unusable, sending singly: {e}")
+                self.fallbacks += 1
+            except Exception as e:
+                # Timeouts, rate limits and outages would only repeat per image: fail the batch
+                for _, future in batch:
+                    future.set_exception(e)
+                return
+
+        for item, future in batch:
+            try:
+                future.set_result(backend.infer(model_type, prompt, item))
+            except Exception as e:
+                future.set_exception(e)
+
+    def stats(self) -> dict:
+        return {
+            'window_s': self.window,
+            'max_size': self.max_size,
+            'requests': self.requests,
+            'batches': self.batches,
+            'batched_images': self.batched_images,
+            'avg_batch_size': round(self.batched_images / self.batches, 2) if self.batches else 0.0,
+            'fallbacks': self.fallbacks
+        }
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+# Local models are image classifiers whose output classes map to the answers the
+# remote model is asked to give; LOCAL_MODEL_DIR/<type>.onnx unless the model's
+# parameters name another model_path
+LOCAL_MODEL_DIR = os.getenv("LOCAL_MODEL_DIR", "models")
+LOCAL_MODEL_RETRY_SECONDS = float(os.getenv("LOCAL_MODEL_RETRY_SECONDS", "30"))  # After a failed load, doubling
+LOCAL_MODEL_MAX_RETRY_SECONDS = float(os.getenv("LOCAL_MODEL_MAX_RETRY_SECONDS", "600"))
+LOCAL_MODEL_LABELS = {
+    'fire': ['No fire detected', 'Fire detected'],
+    'helmet': ['Helmet detected', 'No helmet detected', 'No people detected'],
+    'activity': ['No suspicious activity', 'Fighting', 'Falling down', 'Loitering', 'Aggressive behavior'],
+}
+
+class InferenceBackend(ABC):
+    """Answers a prompt about (image, frame) items; image is base64 JPEG, frame the decoded BGR array or None"""
+
+    name = 'base'
+    remote = False  # Remote backends go through the per-camera rate limits and circuit breakers
+
+    @property
+    def key(self) -> str:
+        """Which model gives the answers, for cache and batch keys"""
+        return self.name
+
+    @abstractmethod
+    def available(self, model_type: str) -> bool:
+        pass
+
+    def infer(self, model_type: str, prompt: str, item: tuple) -> str:
+        """Answer for one item; raises on failure"""
+        return self.infer_many(model_type, prompt, [item])[0]
+
+    @abstractmethod
+    def infer_many(self, model_type: str, prompt: str, items: list) -> List[str]:
+        """Answers for several items, in order; raises on failure"""
+
+    def stats(self) -> dict:
+        return {'name': self.name}
+
+class GeminiBackend(InferenceBackend):
+    """Remote Gemini models, one API key per model type"""
+
+    name = 'gemini'
+    remote = True
+    SYSTEM_PROMPT = """You are a multi-purpose detection assistant. Analyze the provided image and respond accordingly."""
+
     def __init__(self):
         self.fire_model = self._initialize_model(os.getenv("GOOGLE_API_KEY_FIRE"))
         self.helmet_model = self._initialize_model(os.getenv("GOOGLE_API_KEY_HELMET"))
@@ -133,9 +560,6 @@ class Assistant:
         self.helmet_chain = self._create_inference_chain(self.helmet_model) if self.helmet_model else None
         self.activity_chain = self._create_inference_chain(self.activity_model) if self.activity_model else None  
 
-        self.last_inference_time = 0
-        self.inference_cooldown = 0.5
-
     def _initialize_model(self, api_key):
         try:
             if not api_key:
@@ -151,39 +575,40 @@ class Assistant:
             logger.error(f"Model initialization error: {e}")
             return None
 
-    def answer(self, image, prompt, model_type):
-        if model_type == "fire":
-            chain = self.fire_chain
-        elif model_type == "helmet":
-            chain = self.helmet_chain
-        elif model_type == "activity":
-            chain = self.activity_chain 
-        else:
-            return "Invalid model type"
+    def available(self, model_type: str) -> bool:
+        return getattr(self, f"{model_type}_chain", None) is not None
 
+    def infer(self, model_type, prompt, item) -> str:
+        """One remote call for one image"""
+        chain = getattr(self, f"{model_type}_chain", None)
         if not chain:
-            return "Model not initialized"
+            raise ValueError(f"Model not initialized: {model_type}")
+        return chain.invoke(
+            {"prompt": prompt, "image_base64": item[0]},
+            config={"configurable": {"session_id": "unused"}},
+        ).strip()
 
-        current_time = time.time()
-        if current_time - self.last_inference_time < self.inference_cooldown:
-            return None
+    def infer_many(self, model_type, prompt, items) -> List[str]:
+        """One remote call for several images, answered per image; raises if the reply cannot be split"""
+        model = getattr(self, f"{model_type}_model", None)
+        if not model:
+            raise ValueError(f"Model not initialized: {model_type}")
 
-        try:
-            response = chain.invoke(
-                {"prompt": prompt, "image_base64": image},
-                config={"configurable": {"session_id": "unused"}},
-            ).strip()
-            self.last_inference_time = current_time
-            return response
-        except Exception as e:
-            logger.error(f"AI inference error: {str(e)}")
-            return f"Error: {str(e)}"
+        content = [{"type": "text", "text": (
+            f"You are given {len(items)} images from different cameras, numbered 1 to {len(items)}. "
+            f"Answer the following for each image independently: {prompt}\n"
+            f"Reply with only a JSON array of {len(items)} strings, the answer for image 1 first."
+        )}]
+        for number, (image, _) in enumerate(items, 1):
+            content.append({"type": "text", "text": f"Image {number}:"})
+            content.append({"type": "image_url", "image_url": f"data:image/jpeg;base64,{image}"})
 
-    def _create_inference_chain(self, model):
-        SYSTEM_PROMPT = """You are a multi-purpose detection assistant. Analyze the provided image and respond accordingly."""
+        reply = model.invoke([SystemMessage(content=self.SYSTEM_PROMPT), HumanMessage(content=content)])
+        return parse_batch_verdicts(reply.content, len(items))
 
+    def _create_inference_chain(self, model):
         prompt_template = ChatPromptTemplate.from_messages([
-            SystemMessage(content=SYSTEM_PROMPT),
+            SystemMessage(content=self.SYSTEM_PROMPT),
             MessagesPlaceholder(variable_name="chat_history"),
             ("human", [
                 {"type": "text", "text": "{prompt}"},
@@ -199,138 +624,1520 @@ class Assistant:
             history_messages_key="chat_history",
         )
 
+class LocalClassifierBackend(InferenceBackend):
+    """Image classifier on the CPU; every item of a batch goes through one forward pass.
+
+    The prompt is ignored: the model's classes are the answers. Parameters (from the
+    model's system_models parameters) are model_path, labels, input_size, mean, scale
+    and swap_rb.
+    """
+
+    def __init__(self, model_type: str, params: dict):
+        self.model_path = params.get('model_path') or os.path.join(LOCAL_MODEL_DIR, f"{model_type}.onnx")
+        self.labels = params.get('labels') or LOCAL_MODEL_LABELS.get(model_type, [])
+        self.input_size = int(params.get('input_size', 224))
+        self.mean = tuple(params.get('mean', (0, 0, 0)))
+        self.scale = float(params.get('scale', 1 / 255))
+        self.swap_rb = bool(params.get('swap_rb', True))
+        self.model = None
+        self.error = None
+        self.retry_delay = LOCAL_MODEL_RETRY_SECONDS
+        self.retry_at = 0.0
+        self.lock = threading.Lock()
+        self.forward_passes = 0
+        self.frames = 0
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}:{self.model_path}"
+
+    @abstractmethod
+    def _load(self):
+        """The loaded model; raises if it cannot be loaded"""
+
+    @abstractmethod
+    def _forward(self, blob) -> np.ndarray:
+        """Raw scores for an NCHW blob, one row per image"""
+
+    def available(self, model_type: str) -> bool:
+        with self.lock:
+            # A model file that is missing now may be deployed later: retry, backing off
+            if self.model is None and time.time() >= self.retry_at:
+                try:
+                    self.model = self._load()
+                    self.error = None
+                    self.retry_delay = LOCAL_MODEL_RETRY_SECONDS
+                    logger.info(f"✅ Loaded {self.name} model for {model_type}: {self.model_path}")
+                except Exception as e:
+                    self.error = str(e)
+                    self.retry_at = time.time() + self.retry_delay
+                    logger.error(f"❌ Failed to load {self.name} model {self.model_path}, retrying in {self.retry_delay:g}s: {e}")
+                    self.retry_delay = min(self.retry_delay * 2, LOCAL_MODEL_MAX_RETRY_SECONDS)
+            return self.model is not None
+
+    def infer_many(self, model_type, prompt, items) -> List[str]:
+        if not self.available(model_type):
+            raise ValueError(f"Model not initialized: {model_type}")
+        frames = [frame if frame is not None else
+                  cv2.imdecode(np.frombuffer(base64.b64decode(image), np.uint8), cv2.IMREAD_COLOR)
+                  for image, frame in items]
+        blob = cv2.dnn.blobFromImages(frames, self.scale, (self.input_size, self.input_size),
+                                      self.mean, swapRB=self.swap_rb, crop=False)
+        scores = self._forward(blob).reshape(len(frames), -1)
+        self.forward_passes += 1
+        self.frames += len(frames)
+        return [self.labels[i] if i < len(self.labels) else str(i) for i in scores.argmax(axis=1)]
+
+    def stats(self) -> dict:
+        return {
+            'name': self.name,
+            'model_path': self.model_path,
+            'loaded': self.model is not None,
+            'error': self.error,
+            'retry_in_s': round(max(0.0, self.retry_at - time.time()), 1) if self.model is None else None,
+            'forward_passes': self.forward_passes,
+            'avg_batch_size': round(self.frames / self.forward_passes, 2) if self.forward_passes else 0.0
+        }
+
+class OpenCVDnnBackend(LocalClassifierBackend):
+    name = 'opencv'
+
+    def _load(self):
+        net = cv2.dnn.readNet(self.model_path)
+        net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        return net
+
+    def _forward(self, blob) -> np.ndarray:
+        # A Net keeps its input as state, so one forward pass at a time
+        with self.lock:
+            self.model.setInput(blob)
+            return self.model.forward()
+
+class OnnxRuntimeBackend(LocalClassifierBackend):
+    name = 'onnx'
+
+    def _load(self):
+        if ort is None:
+            raise ImportError("onnxruntime is not installed")
+        return ort.InferenceSession(self.model_path, providers=['CPUExecutionProvider'])
+
+    def _forward(self, blob) -> np.ndarray:
+        return self.model.run(None, {self.model.get_inputs()[0].name: blob})[0]
+
+LOCAL_BACKENDS = {'opencv': OpenCVDnnBackend, 'onnx': OnnxRuntimeBackend}
+
+class Assistant:
+    MODEL_TYPES = ("fire", "helmet", "activity")
+
+    def __init__(self):
+        self.gemini = GeminiBackend()
+        # Default backend per model type (INFERENCE_BACKEND_<TYPE>), overridden per (camera, model type)
+        # by the backend a running model's system_models row names; local backends are shared by model path
+        self.backends: Dict[str, InferenceBackend] = {}
+        self.camera_backends: Dict[tuple, InferenceBackend] = {}
+        self.local_backends: Dict[tuple, LocalClassifierBackend] = {}
+        self.backends_lock = threading.Lock()
+        for model_type in self.MODEL_TYPES:
+            self.use_backend(model_type, os.getenv(f"INFERENCE_BACKEND_{model_type.upper()}", "gemini"))
+
+        self.executor = InferenceExecutor()
+        self.buckets: Dict[tuple, TokenBucket] = {}
+        self.buckets_lock = threading.Lock()
+        self.rate_limited = 0
+        self.breakers = {model_type: CircuitBreaker(model_type) for model_type in self.MODEL_TYPES}
+        self.result_cache = InferenceResultCache()
+        self.batcher = InferenceBatcher(self) if INFERENCE_BATCH_WINDOW > 0 else None
+
+    def backend(self, model_type: str, camera_id=None) -> InferenceBackend:
+        """Backend serving model_type on a camera: its model's own choice, else the default"""
+        with self.backends_lock:
+            return self.camera_backends.get((camera_id, model_type)) or self.backends[model_type]
+
+    def _resolve(self, model_type: str, name: str, params: dict = None):
+        """The named backend ('gemini', 'opencv' or 'onnx') for model_type, or None if unknown"""
+        if name == 'gemini':
+            return self.gemini
+        if name not in LOCAL_BACKENDS:
+            logger.error(f"❌ Unknown inference backend '{name}' for {model_type}")
+            return None
+        params = params or {}
+        key = (name, params.get('model_path') or os.path.join(LOCAL_MODEL_DIR, f"{model_type}.onnx"))
+        with self.backends_lock:
+            backend = self.local_backends.get(key)
+            if backend is None:
+                backend = self.local_backends[key] = LOCAL_BACKENDS[name](model_type, params)
+            return backend
+
+    def use_backend(self, model_type: str, name: str, params: dict = None) -> bool:
+        """Serve model_type from the named backend wherever a model does not name its own"""
+        backend = self._resolve(model_type, name, params)
+        if backend is None:
+            return False
+        with self.backends_lock:
+            self.backends[model_type] = backend
+        return True
+
+    def configure(self, camera_id: str, model_type: str, model_details: dict):
+        """Serve a camera's model from the backend its system_models row names (backend column or
+        parameters.backend), or from the default when it names none"""
+        if model_type not in self.MODEL_TYPES:
+            return
+        params = model_details.get('parameters') or {}
+        if isinstance(params, str):
+            try:
+                params = json.loads(params)
+            except ValueError:
+                params = {}
+        name = model_details.get('backend') or params.get('backend')
+        backend = self._resolve(model_type, name, params) if name else None
+        key = (camera_id, model_type)
+        with self.backends_lock:
+            if backend is None:
+                self.camera_backends.pop(key, None)
+                backend = self.backends[model_type]
+            else:
+                self.camera_backends[key] = backend
+        logger.info(f"🔀 {model_type} on camera {camera_id} served by {backend.name}")
+
+    def release(self, camera_id: str, model_type: str):
+        """Forget a stopped model's backend choice"""
+        with self.backends_lock:
+            self.camera_backends.pop((camera_id, model_type), None)
+
+    def answer(self, image, prompt, model_type, frame=None, camera_id=None, use_cache=True):
+        """Ask a model about a base64 image; pass the decoded frame to reuse answers for unchanged scenes"""
+        if model_type not in self.MODEL_TYPES:
+            return "Invalid model type"
+
+        backend = self.backend(model_type, camera_id)
+        if not backend.available(model_type):
+            return "Model not initialized"
+
+        frame_hash = frame_dhash(frame) if frame is not None else None
+        if frame_hash is not None and use_cache:
+            cached = self.result_cache.get(model_type, prompt, camera_id, backend.key, frame_hash)
+            if cached is not None:
+                return cached
+
+        # Each camera and model has its own budget, so a busy camera cannot starve the others;
+        # local models cost no quota and have no endpoint to protect
+        breaker = self.breakers[model_type] if backend.remote else None
+        if backend.remote and not self._bucket(camera_id, model_type).try_take():
+            self.rate_limited += 1
+            return None
+
+        # While the endpoint is failing, skip the call instead of waiting out its timeout
+        admitted = breaker.allow() if breaker is not None else None
+        if breaker is not None and admitted is None:
+            return None
+
+        try:
+            deadline = time.time() + ASSISTANT_REQUEST_DEADLINE
+            item = (image, frame)
+            if self.batcher is not None and camera_id is not None:
+                future = self.batcher.submit(backend, model_type, prompt, item, deadline)
+            else:
+                future = self.executor.submit(lambda: backend.infer(model_type, prompt, item), deadline)
+            # The inference thread is held at most until the deadline; a late answer is dropped
+            try:
+                response = future.result(timeout=max(0.0, deadline - time.time()))
+            except FuturesTimeoutError:
+                raise TimeoutError(f"No answer within {ASSISTANT_REQUEST_DEADLINE:g}s")
+            if breaker is not None:
+                breaker.record_success(admitted)
+            if frame_hash is not None and response:
+                self.result_cache.put(model_type, prompt, camera_id, backend.key, frame_hash, response)
+            return response
+        except Exception as e:
+            if breaker is not None:
+                breaker.record_failure(e, admitted)
+            logger.error(f"AI inference error ({model_type}): {str(e)}")
+            return None
+
+    def _bucket(self, camera_id, model_type) -> TokenBucket:
+        key = (camera_id, model_type)
+        with self.buckets_lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(ASSISTANT_RATE_PER_CAMERA, ASSISTANT_BURST_PER_CAMERA)
+            return bucket
+
+    def is_degraded(self, model_type: str, camera_id=None) -> bool:
+        """Remote model_type is failing (and, given a camera, that camera relies on it)"""
+        if model_type not in self.MODEL_TYPES:
+            return False
+        if camera_id is not None and not self.backend(model_type, camera_id).remote:
+            return False
+        breaker = self.breakers.get(model_type)
+        return breaker is not None and breaker.is_open()
+
+    def breaker_stats(self) -> dict:
+        return {model_type: breaker.stats() for model_type, breaker in self.breakers.items()}
+
+    def stats(self) -> dict:
+        return {
+            'executor': self.executor.stats(),
+            'rate_limited': self.rate_limited,
+            'breakers': self.breaker_stats(),
+            'backends': {model_type: backend.stats() for model_type, backend in self.backends.items()},
+            'camera_backends': [{'camera_id': camera_id, 'model_type': model_type, 'backend': backend.key}
+                                for (camera_id, model_type), backend in list(self.camera_backends.items())],
+            'result_cache': self.result_cache.stats(),
+            'batching': self.batcher.stats() if self.batcher else None
+        }
+
 # Initialize the assistant globally
 assistant = Assistant()
 
+# Capture resolution requested from each camera (0 keeps the source resolution)
+CAPTURE_WIDTH = int(os.getenv("CAMERA_CAPTURE_WIDTH", "640"))
+CAPTURE_HEIGHT = int(os.getenv("CAMERA_CAPTURE_HEIGHT", "480"))
+
+# Named output profiles for video feeds; width None keeps the capture resolution.
+# Every viewer on the same profile shares one downscale and one encode per frame.
+# overlay is the default for ?overlay= (camera name and time drawn on the frame).
+STREAM_PROFILES = {
+    'thumb': {'width': 320, 'fps': 5, 'quality': 60, 'overlay': False},
+    'preview': {'width': 640, 'fps': 15, 'quality': 70, 'overlay': True},
+    'full': {'width': None, 'fps': 30, 'quality': 80, 'overlay': True},
+}
+DEFAULT_STREAM_PROFILE = 'full'
+
+# ?profile=auto moves each viewer along these profiles from how fast its frames leave
+ADAPTIVE_PROFILE = 'auto'
+ADAPTIVE_LADDER = ['thumb', 'preview', 'full']
+ADAPTIVE_START_PROFILE = 'preview'
+ADAPTIVE_WINDOW = 3.0  # Seconds of deliveries per decision
+ADAPTIVE_MAX_LATENCY = float(os.getenv("ADAPTIVE_MAX_LATENCY", "0.5"))  # Capture to sent, in seconds
+ADAPTIVE_UPGRADE_HOLD = 10.0  # Seconds at a level before trying the next one up
+
+# Reconnect backoff for dropped camera streams, in seconds
+RECONNECT_BASE_DELAY = float(os.getenv("CAMERA_RECONNECT_BASE_DELAY", "0.5"))
+RECONNECT_MAX_DELAY = float(os.getenv("CAMERA_RECONNECT_MAX_DELAY", "30"))
+
+# Upper bound on how long opening a camera may block, across all backends
+CAMERA_OPEN_TIMEOUT = float(os.getenv("CAMERA_OPEN_TIMEOUT", "8"))
+CAMERA_BACKENDS = [cv2.CAP_FFMPEG, cv2.CAP_GSTREAMER, cv2.CAP_V4L2, cv2.CAP_ANY]
+# Probes still running for a camera (late losers included) count against its share of the pool
+CAMERA_PROBES_PER_CAMERA = int(os.getenv("CAMERA_PROBES_PER_CAMERA", "2"))
+probe_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='camera-probe')
+
+def camera_backends_for(rtsp_url) -> List[int]:
+    """CAMERA_BACKENDS that can open this source; V4L2 only opens local devices"""
+    if '://' in str(rtsp_url):
+        return [backend for backend in CAMERA_BACKENDS if backend != cv2.CAP_V4L2]
+    return list(CAMERA_BACKENDS)
+
+# In-memory history for event pre-roll and time lookups; 0 seconds disables it. It costs
+# tens of MB per camera, so it is only kept while a subscriber needs history: the models
+# whose events get clips (and whose fire prefilter reads recent frames)
+RING_BUFFER_SECONDS = float(os.getenv("RING_BUFFER_SECONDS", "10"))
+RING_BUFFER_FPS = float(os.getenv("RING_BUFFER_FPS", "5"))
+RING_BUFFER_MODELS = {'fire', 'helmet'}
+
+# Clips recorded around critical events, cut from the ring buffer
+CLIP_DIR = os.getenv("EVENT_CLIP_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "event_clips"))
+CLIP_PRE_ROLL_SECONDS = float(os.getenv("CLIP_PRE_ROLL_SECONDS", "5"))
+CLIP_POST_ROLL_SECONDS = float(os.getenv("CLIP_POST_ROLL_SECONDS", "4"))
+# H.264 so browsers can play clips; builds without an H.264 encoder fall back to mp4v
+CLIP_FOURCC = os.getenv("CLIP_FOURCC", "avc1")
+CLIP_EVENT_TYPES = {'fire_detected', 'helmet_violation'}
+CLIP_RETENTION_HOURS = float(os.getenv("CLIP_RETENTION_HOURS", "168"))
+CLIP_QUOTA_GB = float(os.getenv("CLIP_QUOTA_GB", "5"))
+
+# Continuous recording in fixed-length segments (cameras listed in RECORD_CAMERAS start on boot)
+RECORDING_DIR = os.getenv("RECORDING_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings"))
+RECORDING_SEGMENT_SECONDS = float(os.getenv("RECORDING_SEGMENT_SECONDS", "60"))
+RECORDING_FPS = float(os.getenv("RECORDING_FPS", "10"))
+RECORDING_FOURCC = os.getenv("RECORDING_FOURCC", "avc1")  # H.264, see open_video_writer
+RECORDING_RETENTION_HOURS = float(os.getenv("RECORDING_RETENTION_HOURS", "24"))
+RECORDING_QUOTA_GB = float(os.getenv("RECORDING_QUOTA_GB", "50"))
+RECORDING_MAX_GAP = 2.0  # Seconds without frames before the current segment is closed
+# Camera ids become directory names under RECORDING_DIR and CLIP_DIR
+SAFE_CAMERA_ID = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+def is_safe_camera_id(camera_id) -> bool:
+    return SAFE_CAMERA_ID.fullmatch(str(camera_id)) is not None
+
+# Low-rate thumbnails kept in memory for every open camera (same size as the thumb profile)
+SNAPSHOT_WIDTH = int(os.getenv("SNAPSHOT_WIDTH", str(STREAM_PROFILES['thumb']['width'])))
+SNAPSHOT_QUALITY = int(os.getenv("SNAPSHOT_QUALITY", str(STREAM_PROFILES['thumb']['quality'])))
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "1.0"))
+
+class FrameSubscriber:
+    """Latest-only mailbox for one consumer of a CameraStream; slow consumers skip frames"""
+
+    def __init__(self, stream: 'CameraStream', name: str, max_fps: float = None, due=None):
+        self.stream = stream
+        self.name = name
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.due = due  # Optional callable; frames are only accepted while it returns True
+        self.last_put_time = 0.0
+        self.condition = threading.Condition()
+        self.pending = None  # (seq, frame) not yet taken by the consumer
+        self.pending_time = 0.0
+        self.frame_time = 0.0  # When the frame last returned by get() was published
+        self.closed = False
+        self.connected_at = time.time()
+        self.delivered = 0
+        self.dropped = 0
+        self.delivery_times = deque(maxlen=30)
+        self.adaptive = None  # AdaptiveQualityController for ?profile=auto viewers
+        self.needs_history = False  # Keeps the stream's ring buffer filled while attached
+
+    def set_max_fps(self, max_fps: float):
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+
+    def wants_frame(self, seq: int, now: float) -> bool:
+        """Whether frame number seq would be accepted, given the FPS cap and sampling schedule"""
+        if self.closed:
+            return False
+        if self.min_interval and now - self.last_put_time < self.min_interval:
+            return False
+        if self.due and not self.due():
+            return False
+        return True
+
+    def put(self, seq: int, frame) -> bool:
+        """Called from the capture thread; never blocks on the consumer"""
+        now = time.time()
+        if not self.wants_frame(seq, now):
+            return False
+        self.last_put_time = now
+        with self.condition:
+            if self.pending is not None:
+                self.dropped += 1
+            self.pending = (seq, frame)
+            self.pending_time = now
+            self.condition.notify()
+        return True
+
+    def get(self, timeout: float = 1.0):
+        """Wait for the newest frame; returns (seq, frame), or (None, None) on timeout or close"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.pending is not None or self.closed, timeout)
+            if self.pending is None:
+                return None, None
+            seq, frame = self.pending
+            self.pending = None
+            self.frame_time = self.pending_time
+            self.delivered += 1
+            self.delivery_times.append(time.time())
+            return seq, frame
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def effective_fps(self) -> float:
+        if len(self.delivery_times) < 2:
+            return 0.0
+        elapsed = self.delivery_times[-1] - self.delivery_times[0]
+        return round((len(self.delivery_times) - 1) / elapsed, 2) if elapsed > 0 else 0.0
+
+    def stats(self) -> dict:
+        return {
+            'name': self.name,
+            'connected_at': datetime.fromtimestamp(self.connected_at).isoformat(),
+            'delivered_frames': self.delivered,
+            'dropped_frames': self.dropped,
+            'effective_fps': self.effective_fps(),
+            'adaptive': self.adaptive.stats() if self.adaptive else None
+        }
+
+class AdaptiveQualityController:
+    """Moves one viewer along ADAPTIVE_LADDER based on how its frames are actually delivered.
+
+    A viewer whose socket writes take most of the wall time, or whose frames arrive
+    too late, steps down; one with plenty of idle time steps up after a hold period.
+    Levels are the shared stream profiles, so encode work stays bounded per camera.
+    """
+
+    def __init__(self, start: str = ADAPTIVE_START_PROFILE):
+        self.level = ADAPTIVE_LADDER.index(start)
+        self.last_change = time.time()
+        self.changes = 0
+        self.throughput = None  # Bytes per second while writing
+        self.latency = None
+        self.busy = None
+        self._reset_window(self.last_change)
+
+    def _reset_window(self, now: float):
+        self.window_start = now
+        self.window_frames = 0
+        self.window_bytes = 0
+        self.window_send_time = 0.0
+        self.window_latency = 0.0
+
+    @property
+    def profile(self) -> str:
+        return ADAPTIVE_LADDER[self.level]
+
+    def record(self, size: int, send_time: float, latency: float) -> bool:
+        """Account one delivered frame; True if the viewer moved to another level"""
+        now = time.time()
+        self.window_frames += 1
+        self.window_bytes += size
+        self.window_send_time += send_time
+        self.window_latency += latency
+        elapsed = now - self.window_start
+        if elapsed < ADAPTIVE_WINDOW:
+            return False
+
+        self.busy = self.window_send_time / elapsed
+        self.latency = self.window_latency / self.window_frames
+        self.throughput = self.window_bytes / self.window_send_time if self.window_send_time > 0 else None
+        self._reset_window(now)
+
+        if self.level > 0 and (self.busy > 0.8 or self.latency > ADAPTIVE_MAX_LATENCY):
+            self.level -= 1
+        elif (self.level < len(ADAPTIVE_LADDER) - 1 and self.busy < 0.25
+              and self.latency < ADAPTIVE_MAX_LATENCY / 2 and now - self.last_change >= ADAPTIVE_UPGRADE_HOLD):
+            self.level += 1
+        else:
+            return False
+        self.last_change = now
+        self.changes += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            'profile': self.profile,
+            'changes': self.changes,
+            'busy_ratio': round(self.busy, 2) if self.busy is not None else None,
+            'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+            'throughput_kbps': round(self.throughput * 8 / 1000) if self.throughput else None
+        }
+
+class FrameRingBuffer:
+    """Last N seconds of a camera in one preallocated array, indexed by capture time"""
+
+    def __init__(self, seconds: float = RING_BUFFER_SECONDS, fps: float = RING_BUFFER_FPS):
+        self.capacity = max(0, int(seconds * fps))
+        self.min_interval = 1.0 / fps if fps else 0.0
+        self.lock = threading.Lock()
+        self.frames = None  # Allocated on the first frame, once the shape is known
+        self.timestamps = np.zeros(self.capacity, dtype=np.float64)
+        self.seqs = np.zeros(self.capacity, dtype=np.int64)
+        self.head = 0  # Next slot to write
+        self.count = 0
+        self.next_put_time = 0.0
+        self.users = 0  # Subscribers that need history; frames are only kept while there are any
+
+    @property
+    def active(self) -> bool:
+        return self.capacity > 0 and self.users > 0
+
+    def acquire(self):
+        with self.lock:
+            self.users += 1
+
+    def release(self):
+        """Drop a user; the last one frees the frames"""
+        with self.lock:
+            self.users = max(0, self.users - 1)
+            if not self.users:
+                self.frames = None
+                self.head = 0
+                self.count = 0
+
+    def wants_frame(self, now: float) -> bool:
+        return self.active and now >= self.next_put_time
+
+    def put(self, seq: int, frame, ts: float):
+        """Copy frame into the next slot; called from the capture thread"""
+        if not self.wants_frame(ts):
+            return
+        # Advance on a fixed schedule so the stored rate averages out to the target fps
+        self.next_put_time = max(self.next_put_time, ts - self.min_interval / 2) + self.min_interval
+        with self.lock:
+            if not self.users:
+                return
+            if self.frames is None or self.frames.shape[1:] != frame.shape:
+                # Resolution changed (or first frame): older slots no longer fit
+                self.frames = np.empty((self.capacity,) + frame.shape, dtype=frame.dtype)
+                self.head = 0
+                self.count = 0
+            np.copyto(self.frames[self.head], frame)
+            self.timestamps[self.head] = ts
+            self.seqs[self.head] = seq
+            self.head = (self.head + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def _ordered_slots(self) -> np.ndarray:
+        """Valid slot indices, oldest first"""
+        start = (self.head - self.count) % self.capacity
+        return (start + np.arange(self.count)) % self.capacity
+
+    def frame_at(self, t: float, out=None):
+        """Frame captured closest to time t as (seq, ts, frame), or (None, None, None) if empty"""
+        with self.lock:
+            if not self.count:
+                return None, None, None
+            slots = self._ordered_slots()
+            slot = slots[np.abs(self.timestamps[slots] - t).argmin()]
+            if out is None:
+                out = self.frames[slot].copy()
+            else:
+                np.copyto(out, self.frames[slot])
+            return int(self.seqs[slot]), float(self.timestamps[slot]), out
+
+    def between(self, start: float, end: float = None, out=None):
+        """Frames captured in [start, end] oldest first, as (seqs, timestamps, frames).
+
+        frames is a stacked copy; pass out (at least as large) to reuse a buffer.
+        """
+        with self.lock:
+            if not self.count:
+                return [], [], None
+            slots = self._ordered_slots()
+            ts = self.timestamps[slots]
+            mask = ts >= start if end is None else (ts >= start) & (ts <= end)
+            slots = slots[mask]
+            if out is not None:
+                out = out[:len(slots)]
+            frames = np.take(self.frames, slots, axis=0, out=out)
+            return self.seqs[slots].tolist(), self.timestamps[slots].tolist(), frames
+
+    def last(self, seconds: float, out=None):
+        """Frames from the last `seconds`, oldest first"""
+        return self.between(time.time() - seconds, out=out)
+
+    def index(self, start: float, end: float = None):
+        """(seq, timestamp) of the frames captured in [start, end] oldest first, without copying them"""
+        with self.lock:
+            if not self.count:
+                return []
+            slots = self._ordered_slots()
+            ts = self.timestamps[slots]
+            mask = ts >= start if end is None else (ts >= start) & (ts <= end)
+            slots = slots[mask]
+            return list(zip(self.seqs[slots].tolist(), self.timestamps[slots].tolist()))
+
+    def get(self, seq: int, out=None):
+        """Copy of the frame stored as seq, or None once it has been overwritten"""
+        with self.lock:
+            if not self.count:
+                return None
+            slots = self._ordered_slots()
+            found = slots[self.seqs[slots] == seq]
+            if not len(found):
+                return None
+            if out is None:
+                return self.frames[found[0]].copy()
+            np.copyto(out, self.frames[found[0]])
+            return out
+
+    def stats(self) -> dict:
+        with self.lock:
+            slots = self._ordered_slots() if self.count else []
+            span = float(self.timestamps[slots[-1]] - self.timestamps[slots[0]]) if len(slots) else 0.0
+            return {
+                'capacity': self.capacity,
+                'users': self.users,
+                'frames': self.count,
+                'span_s': round(span, 1),
+                'memory_mb': round(self.frames.nbytes / 1e6, 1) if self.frames is not None else 0.0
+            }
+
+class CameraStream:
+    """Single decoder thread per camera that publishes the latest frame to every consumer.
+
+    The thread also supervises the connection: when reads keep failing it reopens the
+    source with capped exponential backoff while subscribers stay attached.
+    """
+
+    def __init__(self, camera_id: str, manager: 'CameraManager', rtsp_url):
+        self.camera_id = camera_id
+        self.manager = manager
+        self.rtsp_url = rtsp_url
+        self.condition = threading.Condition()
+        self.frame = None
+        self.frame_seq = 0  # Camera frame number of the published frame
+        self.frame_time = 0.0
+        self.waiters = 0
+        self.running = False
+        self.thread = None
+        self.subscribers: List[FrameSubscriber] = []
+        self.subscribers_lock = threading.Lock()
+        self.ring = FrameRingBuffer()
+
+        # Downscaled copies of the latest frame, keyed by width -> (seq, frame)
+        self.scaled_cache: Dict[int, tuple] = {}
+
+        # Encoded JPEGs of the latest frame, keyed by (width, quality, overlay) -> (seq, bytes)
+        self.jpeg_cache: Dict[tuple, tuple] = {}
+        self.encode_locks: Dict[tuple, threading.Lock] = {}
+        self.cache_lock = threading.Lock()
+        self.encode_count = 0
+        self.cache_hits = 0
+
+        # Frames are always grabbed to keep the source drained, but only retrieved
+        # (decoded into BGR) when some consumer will actually use them
+        self.grab_count = 0
+        self.retrieve_count = 0
+        self.retrieve_cpu_time = 0.0
+
+        # Supervisor state
+        self.state = 'live'
+        self.reconnect_requested = False
+        self.reconnect_count = 0
+        self.reconnect_attempts = 0
+        self.downtime = 0.0
+        self.down_since = None
+        self.next_retry_at = None
+        self.last_error = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(
+            target=self._run,
+            daemon=True,
+            name=f"CameraStream-{self.camera_id}"
+        )
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2)
+
+    def request_reconnect(self, rtsp_url=None):
+        """Ask the capture thread to reopen the source right away, without blocking the caller"""
+        with self.condition:
+            if rtsp_url is not None:
+                self.rtsp_url = rtsp_url
+            self.reconnect_requested = True
+            self.condition.notify_all()
+
+    def subscribe(self, name: str, max_fps: float = None, due=None, history: bool = False) -> FrameSubscriber:
+        subscriber = FrameSubscriber(self, name, max_fps, due)
+        subscriber.needs_history = history
+        return self.attach(subscriber)
+
+    def attach(self, subscriber: FrameSubscriber) -> FrameSubscriber:
+        with self.subscribers_lock:
+            self.subscribers.append(subscriber)
+        if subscriber.needs_history:
+            self.ring.acquire()
+        if not self.running:
+            subscriber.close()
+        return subscriber
+
+    def unsubscribe(self, subscriber: FrameSubscriber):
+        with self.subscribers_lock:
+            attached = subscriber in self.subscribers
+            if attached:
+                self.subscribers.remove(subscriber)
+        if attached and subscriber.needs_history:
+            self.ring.release()
+        subscriber.close()
+
+    def latest(self):
+        """Return (seq, frame, timestamp) of the most recent frame without waiting"""
+        with self.condition:
+            return self.frame_seq, self.frame, self.frame_time
+
+    def wait_for_frame(self, last_seq: int, timeout: float = 1.0):
+        """Block until a frame newer than last_seq is published; returns (seq, frame) or (last_seq, None)"""
+        with self.condition:
+            self.waiters += 1
+            try:
+                self.condition.wait_for(
+                    lambda: self.frame_seq != last_seq or not self.running,
+                    timeout
+                )
+            finally:
+                self.waiters -= 1
+            if self.frame is None or self.frame_seq == last_seq:
+                return last_seq, None
+            # Published frames are shared by all consumers and must be treated as read-only
+            return self.frame_seq, self.frame
+
+    def cached_jpeg(self, seq: int, quality: int = 80, overlay=None, width: int = None) -> bytes:
+        """Lock-free lookup of an already encoded frame; None if it still needs encoding"""
+        cached = self.jpeg_cache.get((width, quality, overlay))
+        return cached[1] if cached and cached[0] == seq else None
+
+    def get_scaled(self, seq: int, frame, width: int):
+        """Return frame seq resized to width (aspect preserved), resizing at most once per width"""
+        height, frame_width = frame.shape[:2]
+        if not width or frame_width <= width:
+            return frame
+
+        with self.cache_lock:
+            cached = self.scaled_cache.get(width)
+            if cached and cached[0] == seq:
+                return cached[1]
+
+        scaled = cv2.resize(frame, (width, max(1, height * width // frame_width)),
+                            interpolation=cv2.INTER_AREA)
+        with self.cache_lock:
+            cached = self.scaled_cache.get(width)
+            if not cached or seq > cached[0]:
+                self.scaled_cache[width] = (seq, scaled)
+        return scaled
+
+    def get_jpeg(self, seq: int, frame, quality: int = 80, overlay=None, width: int = None) -> bytes:
+        """Return JPEG bytes for frame seq, encoding at most once per (width, quality, overlay)"""
+        key = (width, quality, overlay)
+        with self.cache_lock:
+            encode_lock = self.encode_locks.setdefault(key, threading.Lock())
+
+        # Concurrent consumers of the same key wait for one encode instead of duplicating it
+        with encode_lock:
+            cached = self.jpeg_cache.get(key)
+            if cached and cached[0] == seq:
+                self.cache_hits += 1
+                return cached[1]
+
+            frame = self.get_scaled(seq, frame, width)
+            if overlay:
+                frame = frame.copy()
+                overlay(frame, self.camera_id, seq)
+
+            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not ret:
+                return None
+
+            frame_bytes = buffer.tobytes()
+            self.encode_count += 1
+            # Never let a lagging consumer replace a newer cached frame
+            if not cached or seq > cached[0]:
+                self.jpeg_cache[key] = (seq, frame_bytes)
+            return frame_bytes
+
+    def capture_time(self, seq: int) -> float:
+        """Capture time of frame seq if it is still the published one, else now"""
+        return self.frame_time if self.frame_seq == seq else time.time()
+
+    def offline_jpeg(self, quality: int = 80, width: int = None) -> bytes:
+        """Last good frame marked as stale, shown to viewers while the camera is down"""
+        seq, frame, _ = self.latest()
+        if frame is None:
+            return None
+        return self.get_jpeg(seq, frame, quality, draw_offline_overlay, width)
+
+    def stats(self) -> dict:
+        skipped = self.grab_count - self.retrieve_count
+        down_since = self.down_since
+        downtime = self.downtime + (time.time() - down_since if down_since else 0.0)
+        avg_retrieve = self.retrieve_cpu_time / self.retrieve_count if self.retrieve_count else 0.0
+        return {
+            'camera_id': self.camera_id,
+            'running': self.running,
+            'state': self.state,
+            'reconnects': self.reconnect_count,
+            'reconnect_attempts': self.reconnect_attempts,
+            'downtime_s': round(downtime, 1),
+            'down_since': datetime.fromtimestamp(down_since).isoformat() if down_since else None,
+            'next_retry_in_s': round(max(0.0, self.next_retry_at - time.time()), 1) if self.next_retry_at else None,
+            'last_error': self.last_error,
+            'frame_seq': self.frame_seq,
+            'last_frame_at': datetime.fromtimestamp(self.frame_time).isoformat() if self.frame_time else None,
+            'jpeg_encodes': self.encode_count,
+            'jpeg_cache_hits': self.cache_hits,
+            'grabbed_frames': self.grab_count,
+            'retrieved_frames': self.retrieve_count,
+            'skipped_retrieves': skipped,
+            'avg_retrieve_ms': round(avg_retrieve * 1000, 2),
+            'decode_cpu_saved_s': round(skipped * avg_retrieve, 2),
+            'ring_buffer': self.ring.stats(),
+            'subscribers': [subscriber.stats() for subscriber in list(self.subscribers)]
+        }
+
+    def _frame_wanted(self, seq: int) -> bool:
+        if self.waiters:
+            return True
+        now = time.time()
+        if self.ring.wants_frame(now):
+            return True
+        with self.subscribers_lock:
+            return any(subscriber.wants_frame(seq, now) for subscriber in self.subscribers)
+
+    def _reconnect(self) -> bool:
+        """Reopen the source with capped, jittered exponential backoff; False if stopped meanwhile"""
+        immediate = self.reconnect_requested
+        self.reconnect_requested = False
+        self.state = 'reconnecting'
+        self.down_since = self.down_since or time.time()
+        self.manager.camera_status[self.camera_id] = False
+        self.manager.release_capture(self.camera_id)
+
+        attempt = 0
+        while self.running:
+            if attempt or not immediate:
+                delay = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * (2 ** attempt))
+                delay = delay / 2 + random.uniform(0, delay / 2)
+                self.next_retry_at = time.time() + delay
+                with self.condition:
+                    # A manual restart cuts the wait short
+                    self.condition.wait_for(lambda: not self.running or self.reconnect_requested, delay)
+                    self.reconnect_requested = False
+                if not self.running:
+                    break
+
+            attempt += 1
+            self.reconnect_attempts += 1
+            self.next_retry_at = None
+            logger.info(f"🔄 Reconnecting camera {self.camera_id} (attempt {attempt})")
+
+            cap = self.manager.open_capture(self.camera_id, self.rtsp_url, allow_fallback=False)
+            if cap and self.manager.replace_capture(self.camera_id, cap):
+                downtime = time.time() - self.down_since
+                self.downtime += downtime
+                self.down_since = None
+                self.reconnect_count += 1
+                self.state = 'live'
+                self.manager.camera_status[self.camera_id] = True
+                logger.info(f"✅ Camera {self.camera_id} reconnected after {downtime:.1f}s")
+                return True
+
+            self.last_error = f"Reconnect attempt {attempt} failed"
+
+        return False
+
+    def _run(self):
+        lock = self.manager.locks.get(self.camera_id)
+        error_count = 0
+        max_errors = 10
+
+        logger.info(f"🎬 Starting capture thread for camera {self.camera_id}")
+
+        while self.running:
+            if self.reconnect_requested or error_count >= max_errors:
+                if not self._reconnect():
+                    break
+                error_count = 0
+                continue
+
+            camera = self.manager.cameras.get(self.camera_id)
+            if camera is None:
+                break
+
+            try:
+                frame = None
+                with lock:
+                    success = camera.grab()
+                    if success and self._frame_wanted(self.grab_count + 1):
+                        # retrieve() is the part skipped frames never pay for
+                        started = time.thread_time()
+                        success, frame = camera.retrieve()
+                        self.retrieve_cpu_time += time.thread_time() - started
+                        self.retrieve_count += 1
+            except Exception as e:
+                logger.error(f"❌ Error reading camera {self.camera_id}: {e}")
+                self.last_error = str(e)
+                success, frame = False, None
+
+            if not success:
+                error_count += 1
+                logger.warning(f"⚠️ Failed to read frame from camera {self.camera_id} (error {error_count}/{max_errors})")
+
+                if error_count >= max_errors:
+                    logger.error(f"❌ Too many errors for camera {self.camera_id}, reconnecting")
+                    self.last_error = 'Too many consecutive read failures'
+                else:
+                    time.sleep(0.1)  # Brief pause before retry
+                continue
+
+            error_count = 0
+            self.grab_count += 1
+            if frame is None:
+                continue  # Grabbed only; nobody needs this frame
+
+            with self.condition:
+                self.frame = frame
+                self.frame_seq = self.grab_count
+                self.frame_time = time.time()
+                self.condition.notify_all()
+                seq = self.frame_seq
+
+            self.ring.put(seq, frame, self.frame_time)
+
+            # Hand the frame to each mailbox; a slow subscriber only ever holds the newest one
+            with self.subscribers_lock:
+                subscribers = list(self.subscribers)
+            for subscriber in subscribers:
+                subscriber.put(seq, frame)
+
+        self.state = 'stopped'
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        with self.subscribers_lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.close()
+
+        # Drop the dead capture so the next consumer reopens the camera
+        if self.manager.streams.get(self.camera_id) is self:
+            self.manager.release_camera(self.camera_id)
+
+        logger.info(f"🛑 Capture thread stopped for camera {self.camera_id}")
+
+def release_probe_result(future):
+    """Done-callback that closes a capture opened by a probe nobody is using"""
+    cap = future.result()
+    if cap is not None:
+        cap.release()
+
 class CameraManager:
     def __init__(self):
         self.cameras: Dict[str, cv2.VideoCapture] = {}
         self.locks: Dict[str, threading.Lock] = {}
-        self.frame_queues: Dict[str, queue.Queue] = {}
         self.camera_status: Dict[str, bool] = {}
+        self.streams: Dict[str, CameraStream] = {}
+        self.registry_lock = threading.RLock()
+        self.opening: Dict[str, Future] = {}  # Camera id -> stream being opened
+        self.probes_running: Dict[str, int] = {}  # Camera id -> backend probes not yet finished
+        self.preferred_backends: Dict[str, int] = {}
 
-    def get_camera(self, camera_id: str, rtsp_url: str) -> cv2.VideoCapture:
-        if camera_id not in self.cameras:
-            logger.info(f"🎥 Initializing camera {camera_id} with URL: {rtsp_url}")
-            
-            # Try different backends for better compatibility
-            cap = None
-            backends = [cv2.CAP_FFMPEG, cv2.CAP_GSTREAMER, cv2.CAP_V4L2, cv2.CAP_ANY]
-            
-            for backend in backends:
-                try:
-                    cap = cv2.VideoCapture(rtsp_url, backend)
-                    if cap.isOpened():
-                        logger.info(f"✅ Camera {camera_id} opened with backend {backend}")
+    def _open_with_backend(self, camera_id: str, rtsp_url, backend: int, timeout: float):
+        """Try a single backend; returns an opened capture or None"""
+        cap = None
+        try:
+            params = []
+            # Let the backend give up on its own where supported, so probe threads are not stuck
+            timeout_ms = max(1, int(timeout * 1000))
+            if hasattr(cv2, 'CAP_PROP_OPEN_TIMEOUT_MSEC'):
+                params += [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout_ms]
+            if hasattr(cv2, 'CAP_PROP_READ_TIMEOUT_MSEC'):
+                params += [cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout_ms]
+            cap = cv2.VideoCapture(rtsp_url, backend, params) if params else cv2.VideoCapture(rtsp_url, backend)
+            if cap.isOpened():
+                return cap
+            cap.release()
+        except Exception as e:
+            logger.warning(f"Failed to open camera {camera_id} with backend {backend}: {e}")
+            if cap:
+                cap.release()
+        return None
+
+    def _run_probe(self, camera_id: str, rtsp_url, backend: int, timeout: float):
+        try:
+            return self._open_with_backend(camera_id, rtsp_url, backend, timeout)
+        finally:
+            with self.registry_lock:
+                self.probes_running[camera_id] -= 1
+
+    def _submit_probe(self, camera_id: str, rtsp_url, backend: int, timeout: float):
+        """Future of a probe, or None if the camera already has CAMERA_PROBES_PER_CAMERA running"""
+        with self.registry_lock:
+            if self.probes_running.get(camera_id, 0) >= CAMERA_PROBES_PER_CAMERA:
+                return None
+            self.probes_running[camera_id] = self.probes_running.get(camera_id, 0) + 1
+        return probe_executor.submit(self._run_probe, camera_id, rtsp_url, backend, timeout)
+
+    def _probe_backends(self, camera_id: str, rtsp_url, backends: List[int], timeout: float):
+        """Open with up to CAMERA_PROBES_PER_CAMERA backends at a time, in order, and keep the
+        first that succeeds within timeout; the rest of the list is not tried after a success"""
+        deadline = time.monotonic() + timeout
+        pending = list(backends)
+        running = {}  # future -> backend
+        winner = None
+        try:
+            while winner is None and (pending or running):
+                while pending:
+                    # CAP_ANY picks one of the other backends again: never run it next to them,
+                    # or the camera gets a second session
+                    if pending[0] == cv2.CAP_ANY and running:
+                        break
+                    future = self._submit_probe(camera_id, rtsp_url, pending[0], max(0.1, deadline - time.monotonic()))
+                    if future is None:
                         break
+                    running[future] = pending.pop(0)
+                if not running:
+                    logger.error(f"❌ Camera {camera_id} still has probes from an earlier open running, not probing")
+                    break
+                done, _ = wait_futures(running, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+                if not done:
+                    raise FuturesTimeoutError()
+                for future in done:
+                    backend = running.pop(future)
+                    if winner is None and future.result() is not None:
+                        winner = backend, future.result()
                     else:
-                        cap.release()
-                        cap = None
-                except Exception as e:
-                    logger.warning(f"Failed to open camera {camera_id} with backend {backend}: {e}")
-                    if cap:
-                        cap.release()
-                        cap = None
-            
-            if not cap or not cap.isOpened():
-                logger.error(f"❌ Failed to open camera {camera_id} with any backend")
-                # Create a dummy camera for testing
-                cap = cv2.VideoCapture(0)  # Try webcam as fallback
-                if not cap.isOpened():
-                    logger.error(f"❌ No fallback camera available for {camera_id}")
-                    return None
-            
-            # Configure camera settings
-            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-            cap.set(cv2.CAP_PROP_FPS, 30)
-            cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-            
+                        release_probe_result(future)
+        except FuturesTimeoutError:
+            logger.error(f"⏱️ Opening camera {camera_id} with backends {backends} timed out after {timeout:.1f}s")
+
+        # Late probes still open a connection; close them whenever they finish
+        for future in running:
+            future.add_done_callback(release_probe_result)
+
+        return winner if winner is not None else (None, None)
+
+    def open_capture(self, camera_id: str, rtsp_url, allow_fallback: bool = True) -> cv2.VideoCapture:
+        """Open and configure a capture for rtsp_url without registering it"""
+        logger.info(f"🎥 Initializing camera {camera_id} with URL: {rtsp_url}")
+        
+        # The backend that worked last time usually works again; it gets half the
+        # deadline on its own before every backend is probed with the rest
+        deadline = time.monotonic() + CAMERA_OPEN_TIMEOUT
+        preferred = self.preferred_backends.get(camera_id)
+        backend, cap = None, None
+        if preferred is not None:
+            backend, cap = self._probe_backends(camera_id, rtsp_url, [preferred], CAMERA_OPEN_TIMEOUT / 2)
+        remaining = deadline - time.monotonic()
+        if cap is None and remaining > 0:
+            # The preferred backend just had its chance (and may still be connecting)
+            backends = [b for b in camera_backends_for(rtsp_url) if b != preferred]
+            backend, cap = self._probe_backends(camera_id, rtsp_url, backends, remaining)
+        
+        if cap is not None:
+            logger.info(f"✅ Camera {camera_id} opened with backend {backend}")
+            self.preferred_backends[camera_id] = backend
+        
+        if not cap or not cap.isOpened():
+            logger.error(f"❌ Failed to open camera {camera_id} with any backend")
+            if not allow_fallback:
+                return None
+            # Create a dummy camera for testing
+            cap = cv2.VideoCapture(0)  # Try webcam as fallback
+            if not cap.isOpened():
+                logger.error(f"❌ No fallback camera available for {camera_id}")
+                return None
+        
+        # Configure camera settings
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        cap.set(cv2.CAP_PROP_FPS, 30)
+        if CAPTURE_WIDTH and CAPTURE_HEIGHT:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAPTURE_WIDTH)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAPTURE_HEIGHT)
+        
+        return cap
+
+    def get_camera(self, camera_id: str, rtsp_url: str) -> cv2.VideoCapture:
+        camera_id = str(camera_id)
+        with self.registry_lock:
+            cap = self.cameras.get(camera_id)
+        if cap is not None:
+            return cap
+
+        # Opening can take CAMERA_OPEN_TIMEOUT; other cameras must not wait for it
+        cap = self.open_capture(camera_id, rtsp_url)
+        if not cap:
+            return None
+
+        with self.registry_lock:
+            existing = self.cameras.get(camera_id)
+            if existing is not None:
+                cap.release()
+                return existing
             self.cameras[camera_id] = cap
             self.locks[camera_id] = threading.Lock()
-            self.frame_queues[camera_id] = queue.Queue(maxsize=2)
             self.camera_status[camera_id] = True
-            
-        return self.cameras[camera_id]
+            return cap
+
+    def get_stream(self, camera_id: str, rtsp_url: str) -> CameraStream:
+        """Get the shared capture stream for a camera, opening it on first use.
+
+        The open runs outside registry_lock; concurrent callers for the same camera
+        wait for that one open instead of starting their own.
+        """
+        camera_id = str(camera_id)  # Ids arrive as JSON ints or strings; streams are keyed by str
+        with self.registry_lock:
+            stream = self.streams.get(camera_id)
+            if stream and stream.running:
+                return stream
+            opening = self.opening.get(camera_id)
+            owner = opening is None
+            if owner:
+                opening = self.opening[camera_id] = Future()
+        if not owner:
+            return opening.result()
+
+        stream = None
+        try:
+            camera = self.get_camera(camera_id, rtsp_url)
+            if camera:
+                stream = CameraStream(camera_id, self, rtsp_url)
+                with self.registry_lock:
+                    self.streams[camera_id] = stream
+                stream.start()
+        finally:
+            with self.registry_lock:
+                self.opening.pop(camera_id, None)
+            opening.set_result(stream)
+        return stream
+
+    def pending_open(self, camera_id: str):
+        """Future of a get_stream open in progress for camera_id, or None"""
+        with self.registry_lock:
+            return self.opening.get(str(camera_id))
+
+    def release_capture(self, camera_id: str):
+        """Close the current capture for a camera but keep it registered for a reconnect"""
+        with self.registry_lock:
+            cap = self.cameras.get(camera_id)
+            lock = self.locks.get(camera_id)
+        if cap is not None and lock is not None:
+            with lock:
+                cap.release()
+
+    def replace_capture(self, camera_id: str, cap: cv2.VideoCapture) -> bool:
+        """Swap in a reopened capture; False (and cap released) if the camera was released meanwhile"""
+        with self.registry_lock:
+            lock = self.locks.get(camera_id)
+        if lock is None:
+            cap.release()
+            return False
+        # The camera lock can be held by a blocking read, so never wait for it under registry_lock
+        with lock:
+            with self.registry_lock:
+                old = self.cameras.get(camera_id)
+                if old is not None:
+                    self.cameras[camera_id] = cap
+            if old is None:
+                cap.release()
+                return False
+            old.release()
+        return True
+
+    def find_stream(self, camera_id: str) -> CameraStream:
+        """The open stream for a camera, or None; never opens one"""
+        return self.streams.get(str(camera_id))
 
     def release_camera(self, camera_id: str):
-        if camera_id in self.cameras:
+        camera_id = str(camera_id)
+        with self.registry_lock:
+            stream = self.streams.pop(camera_id, None)
+        if stream:
+            stream.stop()
+
+        with self.registry_lock:
+            cap = self.cameras.pop(camera_id, None)
+            lock = self.locks.pop(camera_id, None)
+            self.camera_status.pop(camera_id, None)
+        if cap is not None:
             logger.info(f"🛑 Releasing camera {camera_id}")
-            self.cameras[camera_id].release()
-            del self.cameras[camera_id]
-            if camera_id in self.locks:
-                del self.locks[camera_id]
-            if camera_id in self.frame_queues:
-                del self.frame_queues[camera_id]
-            if camera_id in self.camera_status:
-                del self.camera_status[camera_id]
+            with lock:
+                cap.release()
 
     def is_camera_active(self, camera_id: str) -> bool:
         return camera_id in self.cameras and self.camera_status.get(camera_id, False)
 
 camera_manager = CameraManager()
 
-def generate_frames(camera_id: str, rtsp_url: str):
+class TextOverlay:
+    """Text drawn once per second into a mask, then alpha-blended onto each frame's corner.
+
+    lines(camera_id) returns [(text, font_scale, thickness)]; the rendered patch is
+    cached per camera until the wall-clock second changes.
+    """
+
+    def __init__(self, lines, color=(0, 255, 0), background_alpha: float = 0.35):
+        self.lines = lines
+        self.color = color
+        self.background_alpha = background_alpha
+        self.masks: Dict[str, tuple] = {}  # camera id -> (second, inverse alpha, premultiplied patch)
+        self.renders = 0
+
+    def _render(self, camera_id: str):
+        lines = self.lines(camera_id)
+        sizes = [cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)
+                 for text, scale, thickness in lines]
+        width = max(w for (w, _), _ in sizes) + 12
+        height = sum(h + baseline + 8 for (_, h), baseline in sizes) + 4
+
+        text = np.zeros((height, width, 3), dtype=np.uint8)
+        alpha = np.full((height, width), int(255 * self.background_alpha), dtype=np.uint8)
+        y = 4
+        for (line, scale, thickness), ((_, h), baseline) in zip(lines, sizes):
+            y += h + 4
+            cv2.putText(text, line, (6, y), cv2.FONT_HERSHEY_SIMPLEX, scale, self.color, thickness)
+            cv2.putText(alpha, line, (6, y), cv2.FONT_HERSHEY_SIMPLEX, scale, 255, thickness)
+            y += baseline + 4
+
+        # Blending is then two in-place ops per frame: roi * (1 - a) + text * a
+        alpha3 = cv2.merge([alpha, alpha, alpha])
+        premultiplied = cv2.multiply(text, alpha3, scale=1 / 255)
+        inverse_alpha = cv2.subtract(np.full_like(alpha3, 255), alpha3)
+        self.renders += 1
+        return inverse_alpha, premultiplied
+
+    def draw(self, frame, camera_id: str):
+        second = int(time.time())
+        cached = self.masks.get(camera_id)
+        if not cached or cached[0] != second:
+            cached = (second,) + self._render(camera_id)
+            self.masks[camera_id] = cached
+        _, inverse_alpha, premultiplied = cached
+
+        height = min(inverse_alpha.shape[0], frame.shape[0] - 10)
+        width = min(inverse_alpha.shape[1], frame.shape[1] - 10)
+        if height <= 0 or width <= 0:
+            return
+        roi = frame[10:10 + height, 10:10 + width]
+        cv2.multiply(roi, inverse_alpha[:height, :width], dst=roi, scale=1 / 255)
+        cv2.add(roi, premultiplied[:height, :width], dst=roi)
+
+stream_text_overlay = TextOverlay(lambda camera_id: [
+    (f"Camera {camera_id}", 0.6, 2),
+    (datetime.now().strftime('%H:%M:%S'), 0.5, 1)
+])
+capture_text_overlay = TextOverlay(lambda camera_id: [
+    (f"Camera {camera_id} - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", 0.7, 2)
+])
+
+def parse_overlay_arg(value: str, profile: str = None, default: bool = None) -> bool:
+    """?overlay=0/1 for a viewer, defaulting to default or else the profile's setting"""
+    if value is None or value == '':
+        if default is not None:
+            return default
+        return STREAM_PROFILES.get(profile, STREAM_PROFILES[ADAPTIVE_START_PROFILE])['overlay']
+    return value.lower() not in ('0', 'false', 'off', 'no')
+
+def draw_stream_overlay(frame, camera_id: str, seq: int):
+    """Camera name and time overlay used for live video feeds"""
+    stream_text_overlay.draw(frame, camera_id)
+
+def draw_offline_overlay(frame, camera_id: str, seq: int):
+    """Marks the last good frame as stale while a camera reconnects"""
+    frame //= 2
+    cv2.putText(frame, f"Camera {camera_id} - signal lost, reconnecting...", 
+               (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
+
+def draw_capture_overlay(frame, camera_id: str, seq: int):
+    """Timestamp overlay used for single frame captures"""
+    capture_text_overlay.draw(frame, camera_id)
+
+def encode_frame_base64(frame, camera_id: str, quality: int = 70, seq: int = None) -> str:
+    """Base64 JPEG for model uploads; with the stream seq of frame, models sampling the same frame share one encode"""
+    stream = camera_manager.find_stream(camera_id)
+    frame_bytes = None
+    if stream and seq is not None:
+        frame_bytes = stream.get_jpeg(seq, frame, quality)
+    if frame_bytes is None:
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        frame_bytes = buffer.tobytes()
+    return base64.b64encode(frame_bytes).decode()
+
+def profile_error(profile: str, allow_adaptive: bool = False):
+    """Error body for an unknown stream profile, or None if it is valid"""
+    if profile in STREAM_PROFILES or (allow_adaptive and profile == ADAPTIVE_PROFILE):
+        return None
+    profiles = list(STREAM_PROFILES.keys()) + ([ADAPTIVE_PROFILE] if allow_adaptive else [])
+    return {
+        'error': f'Unknown profile: {profile}',
+        'profiles': profiles
+    }
+
+def parse_grid_cameras(value: str):
+    """Split the grid cameras parameter; returns (camera_ids, error)"""
+    camera_ids = [c.strip() for c in (value or '').split(',') if c.strip()]
+    if not camera_ids:
+        return None, 'cameras query parameter is required'
+    if len(camera_ids) > 25:
+        return None, 'A grid supports at most 25 cameras'
+    return camera_ids, None
+
+def encode_error_frame(camera_id: str, profile: str = DEFAULT_STREAM_PROFILE) -> bytes:
+    """Black placeholder frame sent while a camera is not delivering"""
+    settings = STREAM_PROFILES[profile]
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    cv2.putText(frame, f"Camera {camera_id} Error", (50, 240), 
+               cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+    if settings['width']:
+        frame = cv2.resize(frame, (settings['width'], settings['width'] * 3 // 4))
+    ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, settings['quality']])
+    return buffer.tobytes() if ret else None
+
+def mjpeg_part(frame_bytes: bytes) -> bytes:
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+
+def generate_frames(camera_id: str, rtsp_url: str, client: str = 'mjpeg',
+                    profile: str = DEFAULT_STREAM_PROFILE, overlay: bool = None):
     """Generate video frames for streaming"""
-    camera = camera_manager.get_camera(camera_id, rtsp_url)
-    if not camera:
+    stream = camera_manager.get_stream(camera_id, rtsp_url)
+    if not stream:
         logger.error(f"❌ Cannot generate frames for camera {camera_id} - camera not available")
         return
     
-    lock = camera_manager.locks[camera_id]
-    frame_count = 0
+    # An adaptive viewer starts mid-ladder and is moved between the shared profiles
+    adaptive = AdaptiveQualityController() if profile == ADAPTIVE_PROFILE else None
+    settings = STREAM_PROFILES[adaptive.profile if adaptive else profile]
+    if overlay is None:
+        overlay = settings['overlay']
+    # Viewers without an overlay share the plain encode of the frame
+    draw_overlay = draw_stream_overlay if overlay else None
+    client = f"{client}:{profile}"
+    subscriber = stream.subscribe(client, settings['fps'])
+    subscriber.adaptive = adaptive
     error_count = 0
     max_errors = 10
     
-    logger.info(f"🎬 Starting frame generation for camera {camera_id}")
+    logger.info(f"🎬 Starting frame generation for camera {camera_id} ({client})")
     
-    while True:
-        try:
-            with lock:
-                success, frame = camera.read()
+    try:
+        while True:
+            try:
+                seq, frame = subscriber.get(timeout=1.0)
                 
-                if not success:
-                    error_count += 1
-                    logger.warning(f"⚠️ Failed to read frame from camera {camera_id} (error {error_count}/{max_errors})")
-                    
-                    if error_count >= max_errors:
-                        logger.error(f"❌ Too many errors for camera {camera_id}, stopping stream")
-                        camera_manager.camera_status[camera_id] = False
-                        break
+                if frame is None:
+                    if subscriber.closed:
+                        # Follow a restarted stream, or stop once the camera has given up
+                        stream = camera_manager.find_stream(camera_id)
+                        if not stream:
+                            logger.error(f"❌ Stream for camera {camera_id} stopped, ending feed")
+                            break
+                        subscriber = stream.subscribe(client, settings['fps'])
+                        subscriber.adaptive = adaptive
+                        continue
                     
-                    # Send a black frame on error
-                    frame = np.zeros((480, 640, 3), dtype=np.uint8)
-                    cv2.putText(frame, f"Camera {camera_id} Error", (50, 240), 
-                               cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+                    # Keep the viewer connected with the last good frame while the camera is down
+                    frame_bytes = (stream.offline_jpeg(settings['quality'], settings['width'])
+                                   or encode_error_frame(camera_id, adaptive.profile if adaptive else profile))
                 else:
-                    error_count = 0  # Reset error count on successful read
-                    frame_count += 1
+                    error_count = 0
                     
-                    # Add frame info overlay
-                    cv2.putText(frame, f"Camera {camera_id} - Frame {frame_count}", 
-                               (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                    cv2.putText(frame, f"Time: {datetime.now().strftime('%H:%M:%S')}", 
-                               (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+                    # Scaled and encoded once per frame, shared by every viewer on this profile
+                    frame_bytes = stream.get_jpeg(seq, frame, settings['quality'], draw_overlay,
+                                                  settings['width'])
                 
-                # Encode frame
-                ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-                if not ret:
+                if not frame_bytes:
                     logger.error(f"❌ Failed to encode frame from camera {camera_id}")
                     continue
                 
-                frame_bytes = buffer.tobytes()
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+                # The socket write happens outside any camera lock; while it blocks,
+                # the capture thread keeps replacing this subscriber's pending frame
+                part = mjpeg_part(frame_bytes)
+                sent_at = time.time()
+                yield part
                 
-        except Exception as e:
-            logger.error(f"❌ Error in frame generation for camera {camera_id}: {e}")
-            error_count += 1
-            if error_count >= max_errors:
-                break
-            time.sleep(0.1)  # Brief pause before retry
+                if adaptive and frame is not None:
+                    # The generator resumes once the server has written the part
+                    now = time.time()
+                    if adaptive.record(len(part), now - sent_at, now - subscriber.frame_time):
+                        settings = STREAM_PROFILES[adaptive.profile]
+                        subscriber.set_max_fps(settings['fps'])
+                        logger.info(f"📶 {client} on camera {camera_id} moved to {adaptive.profile}: {adaptive.stats()}")
+                    
+            except Exception as e:
+                logger.error(f"❌ Error in frame generation for camera {camera_id}: {e}")
+                error_count += 1
+                if error_count >= max_errors:
+                    break
+                time.sleep(0.1)  # Brief pause before retry
+    finally:
+        subscriber.stream.unsubscribe(subscriber)
+        logger.info(f"🛑 Frame generation ended for camera {camera_id} ({client}): {subscriber.stats()}")
+
+class MosaicComposer:
+    """Tiles the latest frames of several cameras onto one preallocated canvas"""
+
+    def __init__(self, camera_ids: List[str], tile_width: int, tile_height: int):
+        self.camera_ids = camera_ids
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        self.columns = int(np.ceil(np.sqrt(len(camera_ids))))
+        self.rows = int(np.ceil(len(camera_ids) / self.columns))
+
+        # One canvas plus one resize buffer per tile, reused for every tick
+        self.canvas = np.zeros((self.rows * tile_height, self.columns * tile_width, 3), dtype=np.uint8)
+        self.tiles = []
+        for index in range(len(camera_ids)):
+            row, column = divmod(index, self.columns)
+            self.tiles.append(self.canvas[row * tile_height:(row + 1) * tile_height,
+                                          column * tile_width:(column + 1) * tile_width])
+        self.tile_buffers = [np.empty((tile_height, tile_width, 3), dtype=np.uint8) for _ in camera_ids]
+        self.tile_seqs = [None] * len(camera_ids)
+
+    def compose(self, subscribers: List[FrameSubscriber]) -> bool:
+        """Copy any new frames into their tiles; returns True if the canvas changed"""
+        changed = False
+        for index, subscriber in enumerate(subscribers):
+            camera_id = self.camera_ids[index]
+            if subscriber is None or subscriber.closed:
+                seq, frame = -1, None
+            else:
+                seq, frame = subscriber.get(timeout=0)
+                if frame is None:
+                    continue  # No new frame for this tile
 
-def get_rtsp_url(camera_id: str) -> str:
-    """Get RTSP URL for a camera from PostgreSQL database"""
+            if seq == self.tile_seqs[index]:
+                continue
+            self.tile_seqs[index] = seq
+            changed = True
+
+            tile = self.tiles[index]
+            if frame is None:
+                tile[:] = 0
+                cv2.putText(tile, f"Camera {camera_id} offline", (10, self.tile_height // 2),
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+                continue
+
+            cv2.resize(frame, (self.tile_width, self.tile_height), dst=self.tile_buffers[index],
+                       interpolation=cv2.INTER_AREA)
+            np.copyto(tile, self.tile_buffers[index])
+            cv2.putText(tile, f"Camera {camera_id}", (8, 20),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+        return changed
+
+def open_grid_subscribers(camera_ids: List[str], profile: str) -> List[FrameSubscriber]:
+    subscribers = []
+    for camera_id in camera_ids:
+        rtsp_url = get_rtsp_url(camera_id)
+        stream = camera_manager.get_stream(camera_id, rtsp_url) if rtsp_url else None
+        subscribers.append(stream.subscribe(f"grid:{profile}", STREAM_PROFILES[profile]['fps']) if stream else None)
+    return subscribers
+
+def close_grid_subscribers(subscribers: List[FrameSubscriber]):
+    for subscriber in subscribers:
+        if subscriber:
+            subscriber.stream.unsubscribe(subscriber)
+
+def render_grid_tick(composer: MosaicComposer, subscribers: List[FrameSubscriber], profile: str) -> bytes:
+    """Compose one mosaic tick; returns JPEG bytes, or None if no tile changed"""
+    settings = STREAM_PROFILES[profile]
+
+    # Pick up restarted streams without reopening cameras that are down
+    for index, camera_id in enumerate(composer.camera_ids):
+        if subscribers[index] is None or subscribers[index].closed:
+            stream = camera_manager.find_stream(camera_id)
+            if stream and stream.running:
+                subscribers[index] = stream.subscribe(f"grid:{profile}", settings['fps'])
+
+    if not composer.compose(subscribers):
+        return None
+    ret, buffer = cv2.imencode('.jpg', composer.canvas, [cv2.IMWRITE_JPEG_QUALITY, settings['quality']])
+    return buffer.tobytes() if ret else None
+
+def create_grid_composer(camera_ids: List[str], profile: str) -> MosaicComposer:
+    tile_width = STREAM_PROFILES[profile]['width'] or CAPTURE_WIDTH or 640
+    return MosaicComposer(camera_ids, tile_width, tile_width * 3 // 4)
+
+def generate_grid_frames(camera_ids: List[str], profile: str = 'thumb'):
+    """Generate a single MJPEG stream tiling several cameras"""
+    settings = STREAM_PROFILES[profile]
+    composer = create_grid_composer(camera_ids, profile)
+    interval = 1.0 / settings['fps']
+    subscribers = open_grid_subscribers(camera_ids, profile)
+
+    logger.info(f"🧩 Starting grid stream for cameras {camera_ids} ({profile})")
+
+    try:
+        while True:
+            tick_start = time.time()
+            frame_bytes = render_grid_tick(composer, subscribers, profile)
+            if frame_bytes:
+                yield mjpeg_part(frame_bytes)
+            time.sleep(max(0.0, interval - (time.time() - tick_start)))
+    except Exception as e:
+        logger.error(f"❌ Error in grid stream for cameras {camera_ids}: {e}")
+    finally:
+        close_grid_subscribers(subscribers)
+        logger.info(f"🛑 Grid stream ended for cameras {camera_ids}")
+
+def get_rtsp_url(camera_id: str, fallback: bool = True) -> str:
+    """Get RTSP URL for a camera from PostgreSQL database; unknown cameras get the webcam ("0")
+    unless fallback is False, when they get None"""
     conn = None
     try:
         conn = get_db_connection()
@@ -352,12 +2159,15 @@ def get_rtsp_url(camera_id: str) -> str:
             logger.info(f"✅ Found RTSP URL for camera {camera_id}: {rtsp_url}")
             return unquote(rtsp_url)
         else:
+            if not fallback:
+                logger.warning(f"⚠️ No RTSP URL found for camera {camera_id}")
+                return None
             logger.warning(f"⚠️ No RTSP URL found for camera {camera_id}, using webcam fallback")
             return "0"  # Use default webcam
             
     except Exception as e:
         logger.error(f"❌ Error getting RTSP URL for camera {camera_id}: {e}")
-        return "0"  # Fallback to webcam
+        return "0" if fallback else None  # Fallback to webcam
     finally:
         if conn:
             return_db_connection(conn)
@@ -373,9 +2183,14 @@ def video_feed(camera_id):
     
     logger.info(f"📡 Camera {camera_id} source: {rtsp_url}")
     
+    profile = request.args.get('profile', DEFAULT_STREAM_PROFILE)
+    if profile_error(profile, allow_adaptive=True):
+        return jsonify(profile_error(profile, allow_adaptive=True)), 400
+    overlay = parse_overlay_arg(request.args.get('overlay'), profile)
+    
     try:
         response = Response(
-            generate_frames(camera_id, rtsp_url),
+            generate_frames(camera_id, rtsp_url, f"mjpeg:{request.remote_addr}", profile, overlay),
             mimetype='multipart/x-mixed-replace; boundary=frame'
         )
         response.headers['Access-Control-Allow-Origin'] = '*'
@@ -390,6 +2205,29 @@ def video_feed(camera_id):
         logger.error(f"❌ Error creating video feed for camera {camera_id}: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/video_feed/grid')
+def video_feed_grid():
+    """Stream several cameras as one tiled MJPEG, e.g. /video_feed/grid?cameras=1,2,3&profile=thumb"""
+    camera_ids, error = parse_grid_cameras(request.args.get('cameras'))
+    if error:
+        return jsonify({'error': error}), 400
+    
+    profile = request.args.get('profile', 'thumb')
+    if profile_error(profile):
+        return jsonify(profile_error(profile)), 400
+    
+    logger.info(f"🧩 Grid feed requested for cameras {camera_ids}")
+    
+    response = Response(
+        generate_grid_frames(camera_ids, profile),
+        mimetype='multipart/x-mixed-replace; boundary=frame'
+    )
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+    response.headers['Pragma'] = 'no-cache'
+    response.headers['Expires'] = '0'
+    return response
+
 @app.route('/capture_frame/<camera_id>')
 def capture_frame(camera_id):
     """Capture a single frame from a camera"""
@@ -399,29 +2237,24 @@ def capture_frame(camera_id):
     if not rtsp_url:
         return jsonify({'error': 'Camera not found'}), 404
     
-    camera = camera_manager.get_camera(camera_id, rtsp_url)
-    if not camera:
+    stream = camera_manager.get_stream(camera_id, rtsp_url)
+    if not stream:
         return jsonify({'error': 'Failed to initialize camera'}), 500
     
-    lock = camera_manager.locks[camera_id]
-    
     try:
-        with lock:
-            success, frame = camera.read()
-            if not success:
-                logger.error(f"❌ Failed to capture frame from camera {camera_id}")
-                return jsonify({'error': 'Failed to capture frame'}), 500
-            
-            # Add timestamp to frame
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            cv2.putText(frame, f"Camera {camera_id} - {timestamp}", 
-                       (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        # Wait for a fresh frame; the stream retrieves one as soon as there is a waiter
+        last_seq, _, _ = stream.latest()
+        seq, frame = stream.wait_for_frame(last_seq, timeout=5.0)
+        if frame is None:
+            logger.error(f"❌ Failed to capture frame from camera {camera_id}")
+            return jsonify({'error': 'Failed to capture frame'}), 500
+        
+        overlay = parse_overlay_arg(request.args.get('overlay'), default=True)
+        frame_bytes = stream.get_jpeg(seq, frame, 90, draw_capture_overlay if overlay else None)
+        if not frame_bytes:
+            return jsonify({'error': 'Failed to encode frame'}), 500
             
-            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
-            if not ret:
-                return jsonify({'error': 'Failed to encode frame'}), 500
-                
-            return Response(buffer.tobytes(), mimetype='image/jpeg')
+        return Response(frame_bytes, mimetype='image/jpeg')
             
     except Exception as e:
         logger.error(f"❌ Error capturing frame from camera {camera_id}: {e}")
@@ -433,32 +2266,34 @@ def restart_camera(camera_id):
     try:
         logger.info(f"🔄 Restarting camera {camera_id}")
         
-        # Release existing camera
-        camera_manager.release_camera(camera_id)
-        
-        # Small delay
-        time.sleep(1)
-        
-        # Get RTSP URL and reinitialize
         rtsp_url = get_rtsp_url(camera_id)
-        if rtsp_url:
-            camera = camera_manager.get_camera(camera_id, rtsp_url)
-            if camera and camera.isOpened():
-                logger.info(f"✅ Camera {camera_id} restarted successfully")
-                return jsonify({
-                    'status': 'success',
-                    'message': f'Camera {camera_id} restarted'
-                })
-            else:
-                return jsonify({
-                    'status': 'error',
-                    'message': f'Failed to restart camera {camera_id}'
-                }), 500
-        else:
+        if not rtsp_url:
             return jsonify({
                 'status': 'error',
                 'message': f'No RTSP URL found for camera {camera_id}'
             }), 404
+        
+        # A running stream reconnects in the background; viewers keep their connections
+        stream = camera_manager.find_stream(camera_id)
+        if stream and stream.running:
+            stream.request_reconnect(rtsp_url)
+            return jsonify({
+                'status': 'success',
+                'message': f'Camera {camera_id} reconnect scheduled'
+            })
+        
+        stream = camera_manager.get_stream(camera_id, rtsp_url)
+        if stream and stream.running:
+            logger.info(f"✅ Camera {camera_id} restarted successfully")
+            return jsonify({
+                'status': 'success',
+                'message': f'Camera {camera_id} restarted'
+            })
+        else:
+            return jsonify({
+                'status': 'error',
+                'message': f'Failed to restart camera {camera_id}'
+            }), 500
             
     except Exception as e:
         logger.error(f"❌ Camera restart error: {e}")
@@ -524,8 +2359,8 @@ def system_status():
         helmet_model_available = False
         
         if assistant_initialized:
-            fire_model_available = hasattr(assistant, 'fire_model') and assistant.fire_model is not None
-            helmet_model_available = hasattr(assistant, 'helmet_model') and assistant.helmet_model is not None
+            fire_model_available = assistant.backend('fire').available('fire')
+            helmet_model_available = assistant.backend('helmet').available('helmet')
         
         # Get active AI inferences
         active_inferences = {}
@@ -560,7 +2395,9 @@ def system_status():
                 'assistant_initialized': assistant_initialized,
                 'fire_model': fire_model_available,
                 'helmet_model': helmet_model_available,
-                'active_inferences': active_inferences
+                'active_inferences': active_inferences,
+                'backends': {model_type: backend.name for model_type, backend in assistant.backends.items()} if assistant else {},
+                'circuit_breakers': assistant.breaker_stats() if assistant else {}
             },
             'backend': {
                 'connected': db_connected,
@@ -632,9 +2469,9 @@ def handle_model_control():
             if not rtsp_url:
                 return jsonify({'error': 'Camera configuration not found'}), 404
             
-            # Initialize camera if not already done
-            camera = camera_manager.get_camera(camera_id, rtsp_url)
-            if not camera:
+            # Initialize the shared camera stream if not already done
+            stream = camera_manager.get_stream(camera_id, rtsp_url)
+            if not stream:
                 return jsonify({'error': 'Camera unreachable'}), 500
 
             # Start model inference
@@ -928,18 +2765,144 @@ def add_event(event_type, data):
     """Add event to recent events list"""
     with events_lock:
         event = {
-            'id': len(recent_events) + 1,
+            # Monotonic ids so /since/<id> and event stream clients never see an id twice
+            'id': next(event_counter),
             'type': event_type,
             'data': data,
             'timestamp': datetime.now().isoformat()
         }
+        if event_type in CLIP_EVENT_TYPES and isinstance(data, dict) and data.get('camera_id'):
+            if clip_recorder.schedule(event['id'], data['camera_id']):
+                data['clip_url'] = f"/api/events/{event['id']}/clip"
         recent_events.append(event)
         
         # Keep only last 100 events
         if len(recent_events) > 100:
             recent_events.pop(0)
         
+        events_condition.notify_all()
+        for loop, wake in list(event_listeners):
+            try:
+                loop.call_soon_threadsafe(wake.set)
+            except RuntimeError:
+                event_listeners.discard((loop, wake))  # Event loop already closed
         #logger.info(f"📢 Event added: {event_type} - {data}")
+    return event
+
+def get_events_after(event_id: int) -> list:
+    """Events newer than event_id, oldest first"""
+    with events_lock:
+        return [event for event in recent_events if event['id'] > event_id]
+
+def format_sse_event(event: dict) -> str:
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+unavailable_fourccs = set()
+
+def open_video_writer(path: str, fourcc: str, fps: float, size: tuple):
+    """(writer, fourcc used) for an mp4 file, falling back to mp4v when fourcc has no encoder here"""
+    if fourcc not in unavailable_fourccs:
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+        if writer.isOpened() or fourcc == 'mp4v':
+            return writer, fourcc
+        writer.release()
+        unavailable_fourccs.add(fourcc)
+        # mp4v files download fine but do not play in browsers: transcode with ffmpeg -c:v libx264
+        logger.warning(f"⚠️ No {fourcc} encoder in this OpenCV build, writing mp4v instead (not playable in browsers)")
+    return cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size), 'mp4v'
+
+class ClipRecorder:
+    """Writes a short clip around critical events from the camera ring buffer on a background thread"""
+
+    def __init__(self, max_clips: int = 500):
+        self.jobs = queue.Queue()
+        self.clips: Dict[int, dict] = {}  # event id -> clip info
+        self.max_clips = max_clips
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def schedule(self, event_id: int, camera_id: str) -> bool:
+        """Queue a clip for an event; never blocks. False if the camera has no buffered frames"""
+        stream = camera_manager.find_stream(camera_id)
+        if not stream or not stream.ring.active:
+            return False
+
+        trigger_time = time.time()
+        with self.lock:
+            self.clips[event_id] = {
+                'event_id': event_id,
+                'camera_id': stream.camera_id,
+                'status': 'pending',
+                'path': None,
+                'trigger_time': datetime.fromtimestamp(trigger_time).isoformat()
+            }
+            while len(self.clips) > self.max_clips:
+                self.clips.pop(next(iter(self.clips)))
+            if not self.thread or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        self.jobs.put((event_id, stream, trigger_time))
+        return True
+
+    def get(self, event_id: int) -> dict:
+        with self.lock:
+            clip = self.clips.get(event_id)
+            return dict(clip) if clip else None
+
+    def _run(self):
+        while True:
+            event_id, stream, trigger_time = self.jobs.get()
+            # Jobs arrive in trigger order, so waiting for this post-roll never delays an earlier one
+            delay = trigger_time + CLIP_POST_ROLL_SECONDS - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                self._write(event_id, stream, trigger_time)
+            except Exception as e:
+                logger.error(f"❌ Error writing clip for event {event_id}: {e}")
+                self._update(event_id, status='failed', error=str(e))
+
+    def _write(self, event_id: int, stream: CameraStream, trigger_time: float):
+        seqs, timestamps, frames = stream.ring.between(trigger_time - CLIP_PRE_ROLL_SECONDS,
+                                                        trigger_time + CLIP_POST_ROLL_SECONDS)
+        if not seqs:
+            self._update(event_id, status='failed', error='No buffered frames')
+            return
+
+        path = clip_store.segment_path(stream.camera_id, timestamps[0], timestamps[-1])
+        info = {'status': 'ready', 'path': path, 'frames': len(seqs),
+                'duration_s': round(timestamps[-1] - timestamps[0], 1),
+                'pre_roll_s': round(max(0.0, trigger_time - timestamps[0]), 1)}
+        # Events on one camera within the same second cover the same frames: share the file
+        if clip_store.find(stream.camera_id, os.path.basename(path)):
+            self._update(event_id, **info)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        height, width = frames.shape[1:3]
+        fps = len(seqs) / max(timestamps[-1] - timestamps[0], 1e-3) if len(seqs) > 1 else RING_BUFFER_FPS
+        writer, fourcc = open_video_writer(path, CLIP_FOURCC, fps, (width, height))
+        if not writer.isOpened():
+            self._update(event_id, status='failed', error=f'Cannot open writer for {fourcc}')
+            return
+        info['codec'] = fourcc
+        try:
+            for frame in frames:
+                writer.write(frame)
+        finally:
+            writer.release()
+
+        clip_store.add(stream.camera_id, {'start': timestamps[0], 'end': timestamps[-1], 'path': path,
+                                          'bytes': os.path.getsize(path)})
+        self._update(event_id, **info)
+        logger.info(f"🎞️ Saved {len(seqs)}-frame clip for event {event_id} ({stream.camera_id}): {path}")
+
+    def _update(self, event_id: int, **fields):
+        with self.lock:
+            if event_id in self.clips:
+                self.clips[event_id].update(fields)
+
+clip_recorder = ClipRecorder()
 
 def insert_attendance_log(employee_id: str, camera_id: str, gesture: str):
     """Insert attendance log into PostgreSQL database and add event"""
@@ -1044,6 +3007,458 @@ def detect_gesture(hand_landmarks):
         logger.error(f"❌ Error in gesture detection: {e}")
         return None
     
+# Target interval between inferences per model type, in seconds
+MODEL_INFERENCE_INTERVALS = {
+    'helmet': float(os.getenv("INFERENCE_INTERVAL_HELMET", "5")),
+    'fire': float(os.getenv("INFERENCE_INTERVAL_FIRE", "3")),
+    'attendance': float(os.getenv("INFERENCE_INTERVAL_ATTENDANCE", "2")),
+    'activity': float(os.getenv("INFERENCE_INTERVAL_ACTIVITY", "5")),
+}
+
+class InferenceScheduler:
+    """Central per-(camera, model type) deadlines that decide when a frame is sampled"""
+
+    def __init__(self, intervals: Dict[str, float]):
+        self.intervals = intervals
+        self.deadlines: Dict[tuple, float] = {}
+        self.slot_stats: Dict[tuple, dict] = {}
+        self.owners: Dict[tuple, int] = {}  # key -> token of the registration holding the slot
+        self.tokens = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def register(self, camera_id: str, model_type: str) -> int:
+        """Claim the slot for (camera, model type); returns the token to unregister it with"""
+        key = (camera_id, model_type)
+        with self.lock:
+            token = next(self.tokens)
+            self.owners[key] = token
+            self.deadlines[key] = time.time()  # First slot is due immediately
+            self.slot_stats[key] = {'runs': 0, 'total_lateness': 0.0}
+            return token
+
+    def unregister(self, camera_id: str, model_type: str, token: int) -> bool:
+        """Drop the slot unless a newer registration (a restarted model) has taken it over"""
+        key = (camera_id, model_type)
+        with self.lock:
+            if self.owners.get(key) != token:
+                return False
+            del self.owners[key]
+            self.deadlines.pop(key, None)
+            self.slot_stats.pop(key, None)
+            return True
+
+    def interval(self, model_type: str, camera_id: str = None) -> float:
+        interval = self.intervals.get(model_type, 5.0)
+        if assistant is not None and assistant.is_degraded(model_type, camera_id):
+            interval *= BREAKER_DEGRADED_INTERVAL_FACTOR
+        return interval
+
+    def is_due(self, camera_id: str, model_type: str) -> bool:
+        deadline = self.deadlines.get((camera_id, model_type))
+        return deadline is not None and time.time() >= deadline
+
+    def claim(self, camera_id: str, model_type: str) -> bool:
+        """Take the current slot if it is due and schedule the next one"""
+        key = (camera_id, model_type)
+        now = time.time()
+        with self.lock:
+            deadline = self.deadlines.get(key)
+            if deadline is None or now < deadline:
+                return False
+            # Next deadline counts from now so a stalled camera does not burst to catch up
+            self.deadlines[key] = now + self.interval(model_type, camera_id)
+            stats = self.slot_stats[key]
+            stats['runs'] += 1
+            stats['total_lateness'] += now - deadline
+            return True
+
+    def stats(self) -> list:
+        now = time.time()
+        with self.lock:
+            return [{
+                'camera_id': camera_id,
+                'model_type': model_type,
+                'interval_s': self.interval(model_type, camera_id),
+                'next_due_in_s': round(max(0.0, deadline - now), 2),
+                'runs': self.slot_stats[(camera_id, model_type)]['runs'],
+                'avg_lateness_ms': round(
+                    self.slot_stats[(camera_id, model_type)]['total_lateness'] * 1000
+                    / max(1, self.slot_stats[(camera_id, model_type)]['runs']), 1)
+            } for (camera_id, model_type), deadline in self.deadlines.items()]
+
+inference_scheduler = InferenceScheduler(MODEL_INFERENCE_INTERVALS)
+
+# Motion gating: a sampled frame only goes to a model if the scene changed since
+# the last frame that model analyzed, or the heartbeat interval has passed
+MOTION_GATING = os.getenv("MOTION_GATING", "1") != "0"
+MOTION_WIDTH = 160  # Frames are compared at this width, in grayscale
+MOTION_PIXEL_THRESHOLD = 25  # Per-pixel intensity change that counts as changed
+MOTION_MIN_CHANGED = float(os.getenv("MOTION_MIN_CHANGED", "0.01"))  # Fraction of changed pixels
+MOTION_HEARTBEAT_SECONDS = float(os.getenv("MOTION_HEARTBEAT_SECONDS", "60"))
+# A small flame changes far fewer pixels than MOTION_MIN_CHANGED; fire has its own cheap local
+# check (FirePrefilter) and is never motion-gated
+MOTION_UNGATED_MODELS = {'fire'}
+
+class MotionGate:
+    """Cheap frame differencing per (camera, model type) in front of expensive inference"""
+
+    def __init__(self):
+        self.references: Dict[tuple, tuple] = {}  # key -> (small grayscale frame, time analyzed)
+        self.gate_stats: Dict[tuple, dict] = {}
+        self.lock = threading.Lock()
+
+    def _prepare(self, frame):
+        height, width = frame.shape[:2]
+        small = cv2.resize(frame, (MOTION_WIDTH, max(1, height * MOTION_WIDTH // width)),
+                           interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def should_process(self, camera_id: str, model_type: str, frame) -> bool:
+        """True if frame differs enough from the last analyzed one (which it then replaces)"""
+        if not MOTION_GATING or model_type in MOTION_UNGATED_MODELS:
+            return True
+        key = (camera_id, model_type)
+        now = time.time()
+        current = self._prepare(frame)
+        with self.lock:
+            stats = self.gate_stats.setdefault(key, {'checked': 0, 'skipped': 0, 'heartbeats': 0, 'last_change': None})
+            stats['checked'] += 1
+            reference = self.references.get(key)
+
+            if reference is not None and reference[0].shape == current.shape:
+                diff = cv2.absdiff(current, reference[0])
+                changed = cv2.countNonZero(cv2.threshold(diff, MOTION_PIXEL_THRESHOLD, 255, cv2.THRESH_BINARY)[1])
+                stats['last_change'] = round(changed / diff.size, 4)
+                if stats['last_change'] < MOTION_MIN_CHANGED:
+                    if now - reference[1] < MOTION_HEARTBEAT_SECONDS:
+                        stats['skipped'] += 1
+                        return False
+                    # Static scenes still get looked at now and then
+                    stats['heartbeats'] += 1
+
+            self.references[key] = (current, now)
+            return True
+
+    def forget(self, camera_id: str, model_type: str):
+        with self.lock:
+            self.references.pop((camera_id, model_type), None)
+            self.gate_stats.pop((camera_id, model_type), None)
+
+    def stats(self) -> list:
+        with self.lock:
+            return [{
+                'camera_id': camera_id,
+                'model_type': model_type,
+                **stats,
+                'skip_ratio': round(stats['skipped'] / stats['checked'], 3) if stats['checked'] else 0.0
+            } for (camera_id, model_type), stats in self.gate_stats.items()]
+
+motion_gate = MotionGate()
+
+# Local fire/smoke scoring on the CPU: clear cases are decided here, only ambiguous
+# frames (score between the two thresholds) are sent to the remote fire model
+FIRE_PREFILTER = os.getenv("FIRE_PREFILTER", "1") != "0"
+FIRE_PREFILTER_WIDTH = 160
+FIRE_WINDOW_SECONDS = float(os.getenv("FIRE_WINDOW_SECONDS", "2"))  # Recent frames used for flicker and smoke growth
+FIRE_SMOKE_WINDOW_SECONDS = float(os.getenv("FIRE_SMOKE_WINDOW_SECONDS", "60"))  # Smoke can build up slowly
+FIRE_FLAME_AREA = 0.02  # Fraction of flame-colored pixels that counts as a full flame score
+FIRE_MIN_FLAME_RATIO = 0.0002  # A few pixels at prefilter size: below this there is no flame to look at
+FIRE_MIN_FLICKER = 0.3  # Fraction of flame pixels that must come and go within the window
+FIRE_MAX_DRIFT = 0.5  # Flame centroid movement over the window, in blob widths, that still counts as stationary
+FIRE_SMOKE_GROWTH = 0.03  # Growth in smoke-like pixel fraction over the window for a full smoke score
+FIRE_CLEAR_SCORE = float(os.getenv("FIRE_CLEAR_SCORE", "0.15"))  # Below: no fire, decided locally
+FIRE_CONFIRM_SCORE = float(os.getenv("FIRE_CONFIRM_SCORE", "0.8"))  # Above: fire if stationary with smoke, else escalate at once
+
+class FirePrefilter:
+    """HSV flame mask, flame flicker and smoke growth combined into one 0..1 fire score"""
+
+    def __init__(self):
+        self.camera_stats: Dict[str, dict] = {}
+        # Per camera: ring seq -> (flame mask, smoke fraction), so each stored frame is downscaled once
+        self.features: Dict[str, Dict[int, tuple]] = {}
+        # Per camera: (time, smoke fraction) of scored frames over FIRE_SMOKE_WINDOW_SECONDS
+        self.smoke_samples: Dict[str, deque] = {}
+        self.lock = threading.Lock()
+
+    def _small(self, frame):
+        """Downscale a frame to FIRE_PREFILTER_WIDTH, as HSV"""
+        height, width = frame.shape[:2]
+        size = (FIRE_PREFILTER_WIDTH, max(1, height * FIRE_PREFILTER_WIDTH // width))
+        return cv2.cvtColor(cv2.resize(frame, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2HSV)
+
+    @staticmethod
+    def _flame_mask(hsv):
+        # Bright, saturated red-to-yellow (OpenCV hue runs 0..180, red wraps around)
+        h, s, v = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+        return ((h <= 35) | (h >= 170)) & (s >= 100) & (v >= 180)
+
+    @staticmethod
+    def _smoke_mask(hsv):
+        # Grayish haze: low saturation at mid brightness
+        s, v = hsv[..., 1], hsv[..., 2]
+        return (s <= 50) & (v >= 90) & (v <= 220)
+
+    def frame_features(self, frame) -> tuple:
+        """(flame mask, smoke fraction) of one frame at prefilter resolution"""
+        hsv = self._small(frame)
+        return self._flame_mask(hsv), float(self._smoke_mask(hsv).mean())
+
+    @staticmethod
+    def _drift(masks) -> float:
+        """Largest flame centroid movement over the window, in blob widths"""
+        centers, areas = [], []
+        for mask in masks:
+            ys, xs = np.nonzero(mask)
+            if len(xs):
+                centers.append((xs.mean(), ys.mean()))
+                areas.append(len(xs))
+        if len(centers) < 2:
+            return float('inf')
+        centers = np.array(centers)
+        spread = np.linalg.norm(centers - centers.mean(axis=0), axis=1).max()
+        return float(spread / max(np.sqrt(np.mean(areas)), 1.0))
+
+    def score(self, frame, history=None, smoke_baseline=None) -> dict:
+        """Score a frame; history is a list of frame_features() for recent frames, oldest first.
+
+        smoke_baseline is the smoke fraction at the start of the longer smoke window, if known.
+        """
+        flame, smoke_now = self.frame_features(frame)
+        flame_ratio = float(flame.mean())
+        flame_score = min(flame_ratio / FIRE_FLAME_AREA, 1.0)
+
+        flicker = None
+        drift = None
+        smoke_growth = 0.0
+        history = [f for f in history or [] if f[0].shape == flame.shape]
+        if len(history) >= 2:
+            masks = np.stack([mask for mask, _ in history])
+            ever, always = masks.any(axis=0), masks.all(axis=0)
+            seen = int(ever.sum())
+            # Flames change shape frame to frame; an orange sign or a lamp does not
+            flicker = float((ever & ~always).sum()) / seen if seen else 0.0
+            # ...but stay put while they do, unlike an orange vest walking past
+            drift = self._drift(list(masks) + [flame])
+            smoke_growth = smoke_now - history[0][1]
+        if smoke_baseline is not None:
+            smoke_growth = max(smoke_growth, smoke_now - smoke_baseline)
+
+        if flicker is None:
+            flame_score *= 0.5  # Color alone is never conclusive
+        else:
+            flame_score *= min(flicker / FIRE_MIN_FLICKER, 1.0)
+        smoke_score = min(max(smoke_growth, 0.0) / FIRE_SMOKE_GROWTH, 1.0)
+        # Smoke alone can escalate but never confirms fire locally
+        value = max(flame_score, smoke_score * 0.6)
+        return {
+            'score': round(value, 3),
+            'flame_ratio': round(flame_ratio, 4),
+            'flicker': round(flicker, 3) if flicker is not None else None,
+            'drift': round(drift, 2) if drift is not None and drift != float('inf') else None,
+            'stationary': drift is not None and drift <= FIRE_MAX_DRIFT,
+            'smoke_now': round(smoke_now, 4),
+            'smoke_growth': round(smoke_growth, 4)
+        }
+
+    def _history(self, camera_id: str) -> list:
+        """Features of the camera's ring frames in the window, downscaling only frames not seen before"""
+        stream = camera_manager.find_stream(camera_id)
+        if stream is None or not stream.ring.active:
+            return []
+        entries = stream.ring.index(time.time() - FIRE_WINDOW_SECONDS)
+        with self.lock:
+            cached = self.features.get(camera_id, {})
+            # Keep only the frames still in the window; older slots have been overwritten anyway
+            cached = {seq: cached[seq] for seq, _ in entries if seq in cached}
+        history = []
+        for seq, _ in entries:
+            if seq not in cached:
+                frame = stream.ring.get(seq)
+                if frame is None:
+                    continue
+                cached[seq] = self.frame_features(frame)
+            history.append(cached[seq])
+        with self.lock:
+            self.features[camera_id] = cached
+        return history
+
+    def classify(self, camera_id: str, frame) -> tuple:
+        """('clear' | 'fire' | 'urgent' | 'ambiguous', score details) using the camera's recent frames.
+
+        'urgent' is a high score the colors alone cannot confirm: escalate it without the result cache.
+        """
+        now = time.time()
+        with self.lock:
+            samples = self.smoke_samples.setdefault(camera_id, deque())
+            while samples and now - samples[0][0] > FIRE_SMOKE_WINDOW_SECONDS:
+                samples.popleft()
+            smoke_baseline = samples[0][1] if samples else None
+        details = self.score(frame, self._history(camera_id), smoke_baseline)
+        with self.lock:
+            samples.append((now, details['smoke_now']))
+
+        if details['score'] < FIRE_CLEAR_SCORE:
+            # The score grows with flame area; a small flame flickering in place still gets a look
+            small_flame = (details['flame_ratio'] >= FIRE_MIN_FLAME_RATIO and details['stationary']
+                           and (details['flicker'] or 0.0) >= FIRE_MIN_FLICKER)
+            verdict = 'ambiguous' if small_flame else 'clear'
+        elif details['score'] >= FIRE_CONFIRM_SCORE:
+            # Only a stationary, flickering flame that is also making smoke is settled locally
+            confirmed = details['stationary'] and details['smoke_growth'] >= FIRE_SMOKE_GROWTH / 2
+            verdict = 'fire' if confirmed else 'urgent'
+        else:
+            verdict = 'ambiguous'
+        with self.lock:
+            stats = self.camera_stats.setdefault(camera_id, {'checked': 0, 'clear': 0, 'fire': 0, 'urgent': 0, 'escalated': 0})
+            stats['checked'] += 1
+            stats['escalated' if verdict == 'ambiguous' else verdict] += 1
+            if verdict == 'urgent':
+                stats['escalated'] += 1
+            stats['last'] = details
+        return verdict, details
+
+    def stats(self) -> list:
+        with self.lock:
+            return [{
+                'camera_id': camera_id,
+                **stats,
+                'local_ratio': round(1 - stats['escalated'] / stats['checked'], 3) if stats['checked'] else 0.0
+            } for camera_id, stats in self.camera_stats.items()]
+
+fire_prefilter = FirePrefilter()
+
+# Local person detection in front of the helmet and activity models: frames without
+# people are not uploaded, frames with people are cropped to them
+PERSON_GATING = os.getenv("PERSON_GATING", "1") != "0"
+# HOG only finds people at least as tall as its 128px window, so the frame is scaled to make
+# PERSON_MIN_HEIGHT source pixels fill it: 128 runs at source resolution, less upscales
+PERSON_MIN_HEIGHT = int(os.getenv("PERSON_MIN_HEIGHT", "128"))
+PERSON_EMPTY_FRAMES = int(os.getenv("PERSON_EMPTY_FRAMES", "3"))  # Consecutive empty detections before uploads stop
+PERSON_MIN_CONFIDENCE = float(os.getenv("PERSON_MIN_CONFIDENCE", "0.5"))
+PERSON_CROP_PADDING = 0.2  # Margin around the people, as a fraction of their box size
+PERSON_MAX_CROP_AREA = 0.6  # Larger crops are not worth it: send the whole frame
+PERSON_HEARTBEAT_SECONDS = float(os.getenv("PERSON_HEARTBEAT_SECONDS", "60"))  # Full frame now and then in case HOG missed someone
+
+class PersonGate:
+    """OpenCV HOG pedestrian detector deciding what, if anything, to upload per (camera, model type)"""
+
+    HOG_WINDOW_HEIGHT = 128
+
+    def __init__(self):
+        self.local = threading.local()  # One HOGDescriptor per inference thread
+        self.last_sent: Dict[tuple, float] = {}
+        self.empty_runs: Dict[tuple, int] = {}
+        # Latest detection per camera as (seq, people), shared by the helmet and activity models
+        self.detections: Dict[str, tuple] = {}
+        self.camera_locks: Dict[str, threading.Lock] = {}
+        self.gate_stats: Dict[tuple, dict] = {}
+        self.lock = threading.Lock()
+        # OpenCV 5 moved HOG out of the main package
+        self.available = hasattr(cv2, 'HOGDescriptor')
+        if PERSON_GATING and not self.available:
+            logger.warning("⚠️ cv2.HOGDescriptor not available, person gating disabled")
+
+    def _hog(self):
+        hog = getattr(self.local, 'hog', None)
+        if hog is None:
+            hog = self.local.hog = cv2.HOGDescriptor()
+            hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+        return hog
+
+    def detect(self, frame) -> list:
+        """People as (x, y, w, h) boxes in frame coordinates"""
+        height, width = frame.shape[:2]
+        scale = self.HOG_WINDOW_HEIGHT / max(1, PERSON_MIN_HEIGHT)
+        if scale != 1.0:
+            interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+            frame = cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=interpolation)
+        boxes, weights = self._hog().detectMultiScale(frame, winStride=(8, 8), padding=(8, 8), scale=1.05)
+        if len(boxes) == 0:
+            return []
+        boxes = [[int(v) for v in box] for box in boxes]
+        weights = [float(w) for w in np.ravel(weights)]
+        keep = cv2.dnn.NMSBoxes(boxes, weights, PERSON_MIN_CONFIDENCE, 0.4)
+        return [tuple(int(v / scale) for v in boxes[i]) for i in np.ravel(keep)]
+
+    def crop(self, frame, people):
+        """One crop around all people with some margin, or the frame if that saves little"""
+        height, width = frame.shape[:2]
+        x0 = min(x - w * PERSON_CROP_PADDING for x, y, w, h in people)
+        y0 = min(y - h * PERSON_CROP_PADDING for x, y, w, h in people)
+        x1 = max(x + w * (1 + PERSON_CROP_PADDING) for x, y, w, h in people)
+        y1 = max(y + h * (1 + PERSON_CROP_PADDING) for x, y, w, h in people)
+        x0, y0 = max(0, int(x0)), max(0, int(y0))
+        x1, y1 = min(width, int(x1)), min(height, int(y1))
+        if (x1 - x0) * (y1 - y0) > PERSON_MAX_CROP_AREA * width * height:
+            return frame
+        return np.ascontiguousarray(frame[y0:y1, x0:x1])
+
+    def people(self, camera_id: str, frame, seq=None) -> list:
+        """detect() for a stream frame, run once per seq however many models ask"""
+        if seq is None:
+            return self.detect(frame)
+        with self.lock:
+            camera_lock = self.camera_locks.setdefault(camera_id, threading.Lock())
+        # A second model asking for the same frame waits for the first detection instead of repeating it
+        with camera_lock:
+            cached = self.detections.get(camera_id)
+            if cached is not None and cached[0] == seq:
+                return cached[1]
+            people = self.detect(frame)
+            self.detections[camera_id] = (seq, people)
+            return people
+
+    def select(self, camera_id: str, model_type: str, frame, seq=None):
+        """Image to upload for this frame, or None when nobody has been in view for a while"""
+        if not PERSON_GATING or not self.available:
+            return frame
+        key = (camera_id, model_type)
+        people = self.people(camera_id, frame, seq)
+        now = time.time()
+        with self.lock:
+            stats = self.gate_stats.setdefault(key, {'checked': 0, 'skipped': 0, 'cropped': 0, 'heartbeats': 0, 'last_people': 0})
+            stats['checked'] += 1
+            stats['last_people'] = len(people)
+            if not people:
+                # HOG misses people now and then; one empty frame is not enough to stop looking
+                empty = self.empty_runs[key] = self.empty_runs.get(key, 0) + 1
+                if empty < PERSON_EMPTY_FRAMES:
+                    self.last_sent[key] = now
+                    return frame
+                if now - self.last_sent.get(key, 0.0) < PERSON_HEARTBEAT_SECONDS:
+                    stats['skipped'] += 1
+                    return None
+                stats['heartbeats'] += 1
+                self.last_sent[key] = now
+                return frame
+            self.empty_runs[key] = 0
+            self.last_sent[key] = now
+        image = self.crop(frame, people)
+        if image is not frame:
+            with self.lock:
+                stats['cropped'] += 1
+        return image
+
+    def forget(self, camera_id: str, model_type: str):
+        with self.lock:
+            self.last_sent.pop((camera_id, model_type), None)
+            self.empty_runs.pop((camera_id, model_type), None)
+            self.gate_stats.pop((camera_id, model_type), None)
+            if not any(key[0] == camera_id for key in self.gate_stats):
+                self.detections.pop(camera_id, None)
+
+    def stats(self) -> list:
+        with self.lock:
+            return [{
+                'camera_id': camera_id,
+                'model_type': model_type,
+                **stats,
+                'skip_ratio': round(stats['skipped'] / stats['checked'], 3) if stats['checked'] else 0.0
+            } for (camera_id, model_type), stats in self.gate_stats.items()]
+
+person_gate = PersonGate()
+
 def run_model_inference(camera_id, model_id):
     """Run AI model inference on camera feed"""
     logger.info(f"🧠 Starting inference: model {model_id} on camera {camera_id}")
@@ -1053,47 +3468,58 @@ def run_model_inference(camera_id, model_id):
         logger.error(f"❌ No RTSP URL for camera {camera_id}")
         return
     
-    # Create dedicated camera capture for inference
-    cap = cv2.VideoCapture(rtsp_url)
-    if not cap.isOpened():
+    # Subscribe to the shared camera stream instead of opening a second capture
+    stream = camera_manager.get_stream(camera_id, rtsp_url)
+    if not stream:
         logger.error(f"❌ Failed to open camera {camera_id} for inference")
         return
     
     model_details = get_model_details(model_id)
     if not model_details or 'error' in model_details:
         logger.error(f"❌ Failed to get model details for {model_id}")
-        cap.release()
         return
     
-    frame_count = 0
-    process_every_n_frames = 30  # Process every 30th frame to reduce load
+    # The scheduler decides when this camera/model is due; until then the stream
+    # does not even retrieve frames for this subscriber
+    model_type = model_details['type']
+    slot_token = inference_scheduler.register(camera_id, model_type)
+    assistant.configure(camera_id, model_type, model_details)
+    is_due = lambda: inference_scheduler.is_due(camera_id, model_type)
+    history = model_type in RING_BUFFER_MODELS
+    subscriber = stream.subscribe(f"inference:{model_id}", due=is_due, history=history)
     
     try:
         while active_models.get(camera_id, {}).get('running', False):
-            ret, frame = cap.read()
-            if not ret:
-                logger.warning(f"⚠️ Failed to read frame for inference on camera {camera_id}")
-                time.sleep(0.1)
+            seq, frame = subscriber.get(timeout=1.0)
+            if frame is None:
+                if subscriber.closed:
+                    # Reopen the shared stream if the camera dropped out, keep retrying otherwise
+                    logger.warning(f"⚠️ Camera {camera_id} stream stopped, reconnecting for inference")
+                    time.sleep(1)
+                    stream = camera_manager.get_stream(camera_id, rtsp_url)
+                    if stream:
+                        subscriber = stream.subscribe(f"inference:{model_id}", due=is_due, history=history)
                 continue
             
-            frame_count += 1
+            if not inference_scheduler.claim(camera_id, model_type):
+                continue
             
-            # Skip frames to reduce processing load
-            if frame_count % process_every_n_frames != 0:
+            # Nothing changed since this model last looked: skip the expensive call
+            if not motion_gate.should_process(camera_id, model_type, frame):
                 continue
             
             try:
                 # Process based on model type
-                if model_details['type'] == 'helmet':
-                    process_helmet_model(frame, camera_id)
-                elif model_details['type'] == 'fire':
-                    process_fire_model(frame, camera_id)
-                elif model_details['type'] == 'attendance':
+                if model_type == 'helmet':
+                    process_helmet_model(frame, camera_id, seq)
+                elif model_type == 'fire':
+                    process_fire_model(frame, camera_id, seq)
+                elif model_type == 'attendance':
                     process_attendance(frame, camera_id)
-                elif model_details['type'] == 'activity':
-                    process_activity_model(frame, camera_id)
+                elif model_type == 'activity':
+                    process_activity_model(frame, camera_id, seq)
                 else:
-                    logger.warning(f"⚠️ Unknown model type: {model_details['type']}")
+                    logger.warning(f"⚠️ Unknown model type: {model_type}")
                 
             except Exception as e:
                 logger.error(f"❌ Error in model processing for camera {camera_id}: {e}")
@@ -1102,34 +3528,38 @@ def run_model_inference(camera_id, model_id):
     except Exception as e:
         logger.error(f"❌ Error in model inference loop for camera {camera_id}: {e}")
     finally:
-        cap.release()
+        subscriber.stream.unsubscribe(subscriber)
+        if inference_scheduler.unregister(camera_id, model_type, slot_token):
+            assistant.release(camera_id, model_type)
+        motion_gate.forget(camera_id, model_type)
+        person_gate.forget(camera_id, model_type)
         logger.info(f"🛑 Inference stopped for camera {camera_id}")
 
      
-def process_activity_model(frame, camera_id):
+def process_activity_model(frame, camera_id, seq=None):
     #Analyze frame for suspicious activity or unusual behavior
     try:
-        if not hasattr(process_activity_model, "last_detection_time"):
-            process_activity_model.last_detection_time = {}
-
-        current_time = time.time()
-        last_time = process_activity_model.last_detection_time.get(camera_id, 0)
-        if current_time - last_time < 5:
+        # Nobody in view: nothing to analyze
+        image = person_gate.select(camera_id, 'activity', frame, seq)
+        if image is None:
             return
+        if image is not frame:
+            seq = None  # A crop is not the stream's frame
+        frame = image
 
-        process_activity_model.last_detection_time[camera_id] = current_time
-
-        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
-        encoded_frame = base64.b64encode(buffer).decode()
+        encoded_frame = encode_frame_base64(frame, camera_id, seq=seq)
 
         response = assistant.answer(
             encoded_frame,
             "Check this CCTV image for suspicious or dangerous human activities like fighting, falling down, loitering, or aggressive behavior. Respond in simple summary.",
-            "activity"
+            "activity",
+            frame=frame,
+            camera_id=camera_id
         )
 
         if response:
             logger.info(f"⚠️ Activity Detection (Camera {camera_id}): {response}")
+            record_detection(camera_id, 'activity', response)
             add_event("activity_detected", {
                 "camera_id": camera_id,
                 "activity": response,
@@ -1142,85 +3572,87 @@ def process_activity_model(frame, camera_id):
 
 
 
-def process_helmet_model(frame, camera_id):
+def process_helmet_model(frame, camera_id, seq=None):
     """Process frame for helmet detection with events"""
     try:
-        if not hasattr(process_helmet_model, "last_detection_time"):
-            process_helmet_model.last_detection_time = {}
-            
-        current_time = time.time()
-        last_time = process_helmet_model.last_detection_time.get(camera_id, 0)
-        
-        # Process only every 5 seconds to avoid spam
-        if current_time - last_time < 5:
-            return
+        image = person_gate.select(camera_id, 'helmet', frame, seq)
+        if image is None:
+            # Same answer the model gives for an empty scene, without asking it
+            response = 'No people detected'
+        else:
+            encoded_frame = encode_frame_base64(image, camera_id, seq=seq if image is frame else None)
             
-        process_helmet_model.last_detection_time[camera_id] = current_time
-        
-        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
-        encoded_frame = base64.b64encode(buffer).decode()
-        
-        response = assistant.answer(
-            encoded_frame,
-            "Analyze this image for safety helmet compliance. Look for people and determine if they are wearing safety helmets. Respond with either 'Helmet detected' if you see a person wearing a helmet, or 'No helmet detected' if you see a person without a helmet. If no people are visible, respond with 'No people detected'.",
-            "helmet"
-        )
+            response = assistant.answer(
+                encoded_frame,
+                "Analyze this image for safety helmet compliance. Look for people and determine if they are wearing safety helmets. Respond with either 'Helmet detected' if you see a person wearing a helmet, or 'No helmet detected' if you see a person without a helmet. If no people are visible, respond with 'No people detected'.",
+                "helmet",
+                frame=image,
+                camera_id=camera_id
+            )
         
         if response and response != "Model not initialized":
             detected = response.strip()
             camera_name = get_camera_name(camera_id)
             logger.info(f"🪖 {camera_name}: {detected}")
+            record_detection(camera_id, 'helmet', detected)
             
             # Insert detection result into PostgreSQL
-            insert_helmet_violation(camera_id, detected,camera_name)
+            insert_helmet_violation(camera_id, detected, camera_name, datetime.now().isoformat())
             
     except Exception as e:
-        camera_name = get_camera_name(camera_name)
+        camera_name = get_camera_name(camera_id)
         logger.error(f"❌ Helmet detection error for {camera_name}: {e}")
 
-def process_fire_model(frame, camera_id):
+def process_fire_model(frame, camera_id, seq=None):
     """Process frame for fire detection with events"""
     try:
-        if not hasattr(process_fire_model, "last_detection_time"):
-            process_fire_model.last_detection_time = {}
-            
-        current_time = time.time()
-        last_time = process_fire_model.last_detection_time.get(camera_id, 0)
-        
-        # Process only every 3 seconds for fire detection (more frequent due to emergency nature)
-        if current_time - last_time < 3:
-            return
-            
-        process_fire_model.last_detection_time[camera_id] = current_time
-        
-        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
-        encoded_frame = base64.b64encode(buffer).decode()
+        verdict, details = None, None
+        if FIRE_PREFILTER:
+            verdict, details = fire_prefilter.classify(camera_id, frame)
+            if verdict in ('clear', 'fire'):
+                response = 'Fire detected' if verdict == 'fire' else 'No fire detected'
+                record_fire_result(camera_id, response, details)
+                return
+
+        encoded_frame = encode_frame_base64(frame, camera_id, seq=seq)
         
         response = assistant.answer(
             encoded_frame,
             "Analyze this image for fire or smoke. Look for flames, smoke, or signs of fire. Respond with either 'Fire detected' if you see fire, flames, or significant smoke, or 'No fire detected' if the scene appears normal.",
-            "fire"
+            "fire",
+            frame=frame,
+            camera_id=camera_id,
+            use_cache=verdict != 'urgent'
         )
         
-        if response and response != "Model not initialized":
-            detected = response.strip()
-            camera_name = get_camera_name(camera_id)
-            logger.info(f"🔥 {camera_name}: {detected}")
-            
-            # Insert detection result into PostgreSQL
-            insert_fire_detection(camera_id, detected)
+        if (not response or response == "Model not initialized") and details is not None and assistant.is_degraded('fire', camera_id):
+            # Remote model is down: settle on the local score, but only a stationary flame counts as fire
+            if details['score'] >= FIRE_CONFIRM_SCORE and details['stationary']:
+                record_fire_result(camera_id, 'Fire detected', details)
+            elif details['score'] < (FIRE_CLEAR_SCORE + FIRE_CONFIRM_SCORE) / 2:
+                record_fire_result(camera_id, 'No fire detected', details)
+            else:
+                logger.warning(f"⚠️ {get_camera_name(camera_id)}: possible fire (local score {details['score']}), fire model unavailable")
+        elif response and response != "Model not initialized":
+            record_fire_result(camera_id, response.strip())
             
     except Exception as e:
         camera_name = get_camera_name(camera_id)
         logger.error(f"❌ Fire detection error for {camera_name}: {e}")
 
+def record_fire_result(camera_id, detected, details=None):
+    camera_name = get_camera_name(camera_id)
+    source = f" (local score {details['score']})" if details is not None else ""
+    logger.info(f"🔥 {camera_name}: {detected}{source}")
+    record_detection(camera_id, 'fire', detected)
+    
+    # Insert detection result into PostgreSQL
+    insert_fire_detection(camera_id, detected, camera_name, datetime.now().isoformat())
+
 
 def process_attendance(frame, camera_id):
     """Process frame for attendance tracking with events"""
     try:
-        if not hasattr(process_attendance, "last_processed_time"):
-            process_attendance.last_processed_time = {}
-        
         if not hasattr(process_attendance, "employee_cache"):
             process_attendance.employee_cache = {}
         
@@ -1230,12 +3662,8 @@ def process_attendance(frame, camera_id):
         if not hasattr(process_attendance, "last_gesture_time"):
             process_attendance.last_gesture_time = {}
 
-        # Process frame only once every 2 seconds per camera
+        # Sampling cadence comes from the inference scheduler
         current_time = time.time()
-        last_time = process_attendance.last_processed_time.get(camera_id, 0)
-        if current_time - last_time < 2:
-            return
-        process_attendance.last_processed_time[camera_id] = current_time
 
         # Preload employee face encodings (cache per camera)
         if camera_id not in process_attendance.employee_cache:
@@ -1270,11 +3698,14 @@ def process_attendance(frame, camera_id):
         small_frame = cv2.resize(rgb_frame, (0, 0), fx=0.5, fy=0.5)
         face_locations = face_recognition.face_locations(small_frame, model="hog")
         
-        if not face_locations:
-            return
-
         # Scale back up face locations
         face_locations = [(top*2, right*2, bottom*2, left*2) for (top, right, bottom, left) in face_locations]
+        record_detection(camera_id, 'attendance', {
+            'faces': [[left, top, right, bottom] for (top, right, bottom, left) in face_locations]
+        })
+        
+        if not face_locations:
+            return
         face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
 
         # For each face found
@@ -1369,13 +3800,59 @@ def get_events():
 @app.route('/api/events/since/<int:event_id>')
 def get_events_since(event_id):
     """Get events since a specific event ID"""
-    with events_lock:
-        new_events = [event for event in recent_events if event['id'] > event_id]
+    new_events = get_events_after(event_id)
+    return jsonify({
+        'status': 'success',
+        'events': new_events,
+        'count': len(new_events)
+    })
+
+@app.route('/api/events/<int:event_id>/clip')
+def get_event_clip(event_id):
+    """Video clip recorded around an event (202 while it is still being written)"""
+    clip = clip_recorder.get(event_id)
+    if not clip:
         return jsonify({
-            'status': 'success',
-            'events': new_events,
-            'count': len(new_events)
-        })
+            'status': 'error',
+            'message': f'No clip for event {event_id}'
+        }), 404
+    if clip['status'] != 'ready':
+        code = 202 if clip['status'] == 'pending' else 500
+        return jsonify({'status': clip['status'], 'clip': clip}), code
+    if not os.path.exists(clip['path']):
+        return jsonify({
+            'status': 'expired',
+            'message': f'Clip for event {event_id} was removed by retention'
+        }), 410
+    return send_file(clip['path'], mimetype='video/mp4', conditional=True)
+
+@app.route('/api/events/stream')
+def stream_events():
+    """Server-sent events stream of new events (resume with ?since=<event_id>)"""
+    last_id = request.args.get('since', type=int)
+    if last_id is None:
+        with events_lock:
+            last_id = recent_events[-1]['id'] if recent_events else 0
+
+    def generate_events(last_id):
+        while True:
+            with events_condition:
+                events_condition.wait_for(
+                    lambda: bool(recent_events) and recent_events[-1]['id'] > last_id,
+                    timeout=15
+                )
+            new_events = get_events_after(last_id)
+            if not new_events:
+                yield ': keepalive\n\n'
+                continue
+            for event in new_events:
+                yield format_sse_event(event)
+            last_id = new_events[-1]['id']
+
+    response = Response(generate_events(last_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
     
 @app.route('/api/test_events')
 def test_events():
@@ -1506,13 +3983,15 @@ def get_camera_status_endpoint(camera_id):
         rtsp_url = get_rtsp_url(camera_id)
         is_active = camera_manager.is_camera_active(camera_id)
         has_active_model = camera_id in active_models and active_models[camera_id].get('running', False)
+        stream = camera_manager.find_stream(camera_id)
         
         return jsonify({
             'camera_id': camera_id,
             'rtsp_url': rtsp_url,
             'is_active': is_active,
             'has_active_model': has_active_model,
-            'model_info': active_models.get(camera_id, {}) if has_active_model else None
+            'model_info': active_models.get(camera_id, {}) if has_active_model else None,
+            'stream': stream.stats() if stream else None
         })
     except Exception as e:
         logger.error(f"❌ Error getting camera status: {e}")
@@ -1530,6 +4009,24 @@ def debug_active_models():
         'camera_status': camera_manager.camera_status
     })
 
+@app.route('/debug/scheduler', methods=['GET'])
+def debug_scheduler():
+    """Debug endpoint to inspect inference sampling slots"""
+    return jsonify({
+        'slots': inference_scheduler.stats(),
+        'motion': motion_gate.stats(),
+        'fire_prefilter': fire_prefilter.stats(),
+        'person_gate': person_gate.stats(),
+        'assistant': assistant.stats()
+    })
+
+@app.route('/debug/streams', methods=['GET'])
+def debug_streams():
+    """Debug endpoint to inspect shared camera streams"""
+    return jsonify({
+        'streams': [stream.stats() for stream in list(camera_manager.streams.values())]
+    })
+
 @app.route('/debug/database', methods=['GET'])
 def debug_database():
     """Debug endpoint to check database connection"""
@@ -1787,57 +4284,41 @@ def list_available_cameras():
         'opencv_version': cv2.__version__
     })
 
+def encode_test_pattern_frame() -> bytes:
+    """Animated test pattern used when no webcam is available"""
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+
+    # Add some animation based on time
+    t = int(time.time() * 2) % 255
+    frame[:, :] = [t, 255-t, 128]  # Animated colors
+
+    # Add text
+    cv2.putText(frame, f'Test Feed {t}', (50, 50), 
+               cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+
+    ret, buffer = cv2.imencode('.jpg', frame)
+    return buffer.tobytes() if ret else None
+
+SIMPLE_FEED_CAMERA_ID = 'webcam-0'
+
+def generate_simple_frames(client: str = 'simple'):
+    """Webcam 0 feed, shared like any camera, or an animated test pattern when no webcam is present"""
+    stream = camera_manager.get_stream(SIMPLE_FEED_CAMERA_ID, 0)
+    if stream:
+        yield from generate_frames(SIMPLE_FEED_CAMERA_ID, 0, client)
+        return
+
+    while True:
+        frame_bytes = encode_test_pattern_frame()
+        if frame_bytes:
+            yield mjpeg_part(frame_bytes)
+
+        time.sleep(0.1)  # 10 FPS
+
 @app.route('/video_feed_simple')
 def video_feed_simple():
     """Simple video feed that should work"""
-    def generate_simple_frames():
-        cap = cv2.VideoCapture(0)  # Use first webcam
-        
-        if not cap.isOpened():
-            # If no webcam, generate a test pattern
-            import numpy as np
-            import time
-            
-            while True:
-                # Create a simple animated test pattern
-                frame = np.zeros((480, 640, 3), dtype=np.uint8)
-                
-                # Add some animation based on time
-                t = int(time.time() * 2) % 255
-                frame[:, :] = [t, 255-t, 128]  # Animated colors
-                
-                # Add text
-                cv2.putText(frame, f'Test Feed {t}', (50, 50), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-                
-                ret, buffer = cv2.imencode('.jpg', frame)
-                if ret:
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-                
-                time.sleep(0.1)  # 10 FPS
-        else:
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                
-                # Add timestamp to frame
-                import time
-                timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-                cv2.putText(frame, timestamp, (10, 30), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                
-                ret, buffer = cv2.imencode('.jpg', frame)
-                if not ret:
-                    break
-                
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-            
-            cap.release()
-    
-    return Response(generate_simple_frames(), 
+    return Response(generate_simple_frames(f"simple:{request.remote_addr}"), 
                    mimetype='multipart/x-mixed-replace; boundary=frame')
 
 # Error handlers
@@ -1861,6 +4342,10 @@ def shutdown():
             active_models[camera_id]['running'] = False
         active_models.clear()
         
+        # Finish open recording segments before the cameras go away
+        for camera_id in list(recorders.keys()):
+            stop_recording(camera_id)
+        
         # Release all cameras
         for camera_id in list(camera_manager.cameras.keys()):
             camera_manager.release_camera(camera_id)
@@ -1885,6 +4370,949 @@ def test_new_endpoint():
         'timestamp': datetime.now().isoformat()
     })
 
+# Continuous segmented recording
+#
+# Each recorded camera gets one more subscriber on its shared stream, so recording
+# never opens a second connection. Segments are named after the wall-clock span they
+# cover, which lets the index be rebuilt from the directory listing on startup.
+
+SEGMENT_TIME_FORMAT = '%Y%m%d_%H%M%S'
+
+class RecordingStore:
+    """Time index of finished segments (or event clips) per camera, with retention and disk quota eviction"""
+
+    def __init__(self, root: str = RECORDING_DIR, retention_hours: float = RECORDING_RETENTION_HOURS,
+                 quota_gb: float = RECORDING_QUOTA_GB, kind: str = 'recording segments'):
+        self.root = root
+        self.retention_hours = retention_hours
+        self.quota_gb = quota_gb
+        self.kind = kind
+        self.lock = threading.Lock()
+        self.segments: Dict[str, List[dict]] = {}  # camera id -> segments, oldest first
+        self.total_bytes = 0
+        self.evicted = 0
+
+    def segment_path(self, camera_id: str, start: float, end: float = None) -> str:
+        if not is_safe_camera_id(camera_id):
+            raise ValueError(f"Unsafe camera id for a file path: {camera_id!r}")
+        name = datetime.fromtimestamp(start).strftime(SEGMENT_TIME_FORMAT)
+        if end is None:
+            name += '.part'
+        else:
+            name += '-' + datetime.fromtimestamp(end).strftime(SEGMENT_TIME_FORMAT)
+        return os.path.join(self.root, str(camera_id), name + '.mp4')
+
+    def load(self):
+        """Rebuild the index from segment file names on disk; call once at server startup"""
+        if not os.path.isdir(self.root):
+            return
+        for camera_id in os.listdir(self.root):
+            camera_dir = os.path.join(self.root, camera_id)
+            if not os.path.isdir(camera_dir):
+                continue
+            for filename in os.listdir(camera_dir):
+                path = os.path.join(camera_dir, filename)
+                if filename.endswith('.part.mp4'):
+                    # Interrupted segment; without its trailer the file is not playable
+                    logger.warning(f"⚠️ Removing unfinished recording segment {path}")
+                    os.remove(path)
+                    continue
+                try:
+                    start, end = filename[:-len('.mp4')].split('-')
+                    start = datetime.strptime(start, SEGMENT_TIME_FORMAT).timestamp()
+                    end = datetime.strptime(end, SEGMENT_TIME_FORMAT).timestamp()
+                except ValueError:
+                    continue
+                self._insert(camera_id, {'start': start, 'end': end, 'path': path,
+                                         'bytes': os.path.getsize(path)})
+        for segments in self.segments.values():
+            segments.sort(key=lambda segment: segment['start'])
+        if self.total_bytes:
+            logger.info(f"📼 Indexed {sum(len(s) for s in self.segments.values())} {self.kind} "
+                        f"({self.total_bytes / 1e9:.2f} GB)")
+
+    def _insert(self, camera_id: str, segment: dict):
+        self.segments.setdefault(camera_id, []).append(segment)
+        self.total_bytes += segment['bytes']
+
+    def add(self, camera_id: str, segment: dict):
+        with self.lock:
+            self._insert(camera_id, segment)
+        self.enforce_limits()
+
+    def enforce_limits(self):
+        """Drop segments past retention, then the oldest ones until under the disk quota"""
+        cutoff = time.time() - self.retention_hours * 3600
+        quota = self.quota_gb * 1e9
+        evict = []
+        with self.lock:
+            for camera_id, segments in self.segments.items():
+                while segments and segments[0]['end'] < cutoff:
+                    evict.append(self._pop_oldest(camera_id))
+            while self.total_bytes > quota:
+                oldest = min((segments[0]['start'], camera_id)
+                             for camera_id, segments in self.segments.items() if segments)
+                evict.append(self._pop_oldest(oldest[1]))
+
+        for segment in evict:
+            try:
+                os.remove(segment['path'])
+            except OSError as e:
+                logger.warning(f"⚠️ Could not remove {segment['path']}: {e}")
+        if evict:
+            logger.info(f"🧹 Evicted {len(evict)} {self.kind}")
+
+    def _pop_oldest(self, camera_id: str) -> dict:
+        segment = self.segments[camera_id].pop(0)
+        self.total_bytes -= segment['bytes']
+        self.evicted += 1
+        return segment
+
+    def find(self, camera_id: str, filename: str) -> dict:
+        with self.lock:
+            for segment in self.segments.get(camera_id, []):
+                if os.path.basename(segment['path']) == filename:
+                    return segment
+        return None
+
+    def query(self, camera_id: str, start: float = None, end: float = None) -> List[dict]:
+        """Segments overlapping [start, end], oldest first"""
+        with self.lock:
+            return [dict(segment) for segment in self.segments.get(camera_id, [])
+                    if (start is None or segment['end'] >= start) and (end is None or segment['start'] <= end)]
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'segments': sum(len(segments) for segments in self.segments.values()),
+                'total_gb': round(self.total_bytes / 1e9, 3),
+                'quota_gb': self.quota_gb,
+                'retention_hours': self.retention_hours,
+                'evicted': self.evicted
+            }
+
+class SegmentRecorder:
+    """Writes one camera's shared stream to fixed-length segments on its own thread"""
+
+    def __init__(self, camera_id: str, rtsp_url, store: RecordingStore):
+        self.camera_id = camera_id
+        self.rtsp_url = rtsp_url
+        self.store = store
+        self.running = False
+        self.thread = None
+        self.writer = None
+        self.segment_start = 0.0
+        self.frame_size = None
+        self.frames_written = 0  # In the current segment, including repeats that fill gaps
+        self.last_frame_time = 0.0
+        self.segments_written = 0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5)
+
+    def _open_segment(self, now: float, frame) -> bool:
+        height, width = frame.shape[:2]
+        path = self.store.segment_path(self.camera_id, now)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        writer, fourcc = open_video_writer(path, RECORDING_FOURCC, RECORDING_FPS, (width, height))
+        if not writer.isOpened():
+            logger.error(f"❌ Cannot open recording segment {path} ({fourcc})")
+            return False
+        self.writer = writer
+        self.segment_start = now
+        self.frame_size = (height, width)
+        self.frames_written = 0
+        return True
+
+    def _close_segment(self):
+        if not self.writer:
+            return
+        self.writer.release()
+        self.writer = None
+        part_path = self.store.segment_path(self.camera_id, self.segment_start)
+        end = self.segment_start + self.frames_written / RECORDING_FPS
+        path = self.store.segment_path(self.camera_id, self.segment_start, end)
+        try:
+            os.replace(part_path, path)
+        except OSError as e:
+            logger.error(f"❌ Could not finalize recording segment {part_path}: {e}")
+            return
+        self.segments_written += 1
+        self.store.add(self.camera_id, {'start': self.segment_start, 'end': end, 'path': path,
+                                        'bytes': os.path.getsize(path)})
+
+    def _run(self):
+        logger.info(f"📼 Recording camera {self.camera_id}")
+        stream = camera_manager.get_stream(self.camera_id, self.rtsp_url)
+        subscriber = stream.subscribe(f"recorder:{self.camera_id}", RECORDING_FPS) if stream else None
+        try:
+            while self.running:
+                if subscriber is None or subscriber.closed:
+                    # Stream was released; reopen it like any other consumer would
+                    self._close_segment()
+                    time.sleep(1)
+                    stream = camera_manager.get_stream(self.camera_id, self.rtsp_url)
+                    subscriber = stream.subscribe(f"recorder:{self.camera_id}", RECORDING_FPS) if stream else None
+                    continue
+
+                seq, frame = subscriber.get(timeout=1.0)
+                now = time.time()
+                if frame is None:
+                    if self.writer and now - self.last_frame_time > RECORDING_MAX_GAP:
+                        self._close_segment()
+                    continue
+
+                if self.writer and (now - self.segment_start >= RECORDING_SEGMENT_SECONDS
+                                    or now - self.last_frame_time > RECORDING_MAX_GAP
+                                    or frame.shape[:2] != self.frame_size):
+                    self._close_segment()
+                if not self.writer and not self._open_segment(now, frame):
+                    time.sleep(1)
+                    continue
+
+                # Keep the file on the wall-clock timeline: repeat the frame over short delivery gaps
+                due = int((now - self.segment_start) * RECORDING_FPS) + 1
+                while self.frames_written < due:
+                    self.writer.write(frame)
+                    self.frames_written += 1
+                self.last_frame_time = now
+        except Exception as e:
+            logger.error(f"❌ Recording error for camera {self.camera_id}: {e}")
+        finally:
+            self._close_segment()
+            if subscriber:
+                subscriber.stream.unsubscribe(subscriber)
+            self.running = False
+            logger.info(f"🛑 Stopped recording camera {self.camera_id}")
+
+    def stats(self) -> dict:
+        return {
+            'camera_id': self.camera_id,
+            'running': self.running,
+            'segment_started': datetime.fromtimestamp(self.segment_start).isoformat() if self.writer else None,
+            'segments_written': self.segments_written
+        }
+
+recording_store = RecordingStore()
+# Event clips are named and evicted like segments, under their own (smaller) limits
+clip_store = RecordingStore(CLIP_DIR, CLIP_RETENTION_HOURS, CLIP_QUOTA_GB, 'event clips')
+recorders: Dict[str, SegmentRecorder] = {}
+recorders_lock = threading.Lock()
+
+def start_recording(camera_id: str) -> bool:
+    """Start recording a known camera; False for unknown or unsafe ids"""
+    if not is_safe_camera_id(camera_id):
+        return False
+    # Without a camera row the webcam fallback would be recorded under this id
+    rtsp_url = get_rtsp_url(camera_id, fallback=False)
+    if not rtsp_url:
+        return False
+    with recorders_lock:
+        recorder = recorders.get(camera_id)
+        if recorder and recorder.running:
+            return True
+        recorder = SegmentRecorder(camera_id, rtsp_url, recording_store)
+        recorders[camera_id] = recorder
+        recorder.start()
+    return True
+
+def stop_recording(camera_id: str) -> bool:
+    with recorders_lock:
+        recorder = recorders.pop(camera_id, None)
+    if not recorder:
+        return False
+    recorder.stop()
+    return True
+
+def parse_time_arg(name: str):
+    """Query arg as epoch seconds or ISO timestamp; None if absent"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def segment_info(camera_id: str, segment: dict) -> dict:
+    return {
+        'start': datetime.fromtimestamp(segment['start']).isoformat(),
+        'end': datetime.fromtimestamp(segment['end']).isoformat(),
+        'duration_s': round(segment['end'] - segment['start'], 1),
+        'size_bytes': segment['bytes'],
+        'url': f"/recordings/{camera_id}/segments/{os.path.basename(segment['path'])}"
+    }
+
+@app.route('/recordings', methods=['GET'])
+def list_recorders():
+    """Recording status for all cameras plus disk usage"""
+    with recorders_lock:
+        active = [recorder.stats() for recorder in recorders.values()]
+    return jsonify({
+        'status': 'success',
+        'recorders': active,
+        'storage': recording_store.stats()
+    })
+
+@app.route('/recordings/<camera_id>/start', methods=['POST'])
+def start_camera_recording(camera_id):
+    """Start continuous recording for a camera"""
+    if not start_recording(camera_id):
+        return jsonify({
+            'status': 'error',
+            'message': f'Unknown camera {camera_id}'
+        }), 404
+    return jsonify({'status': 'success', 'message': f'Recording camera {camera_id}'})
+
+@app.route('/recordings/<camera_id>/stop', methods=['POST'])
+def stop_camera_recording(camera_id):
+    """Stop continuous recording for a camera"""
+    if not stop_recording(camera_id):
+        return jsonify({
+            'status': 'error',
+            'message': f'Camera {camera_id} is not recording'
+        }), 404
+    return jsonify({'status': 'success', 'message': f'Stopped recording camera {camera_id}'})
+
+@app.route('/recordings/<camera_id>', methods=['GET'])
+def list_recordings(camera_id):
+    """Segments for a camera, filtered with ?start=&end=, or the one containing ?at="""
+    try:
+        at = parse_time_arg('at')
+        start = parse_time_arg('start')
+        end = parse_time_arg('end')
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Times must be epoch seconds or ISO format'}), 400
+
+    if at is not None:
+        segments = recording_store.query(camera_id, at, at)
+        if not segments:
+            return jsonify({'status': 'error', 'message': 'No recording at that time'}), 404
+        info = segment_info(camera_id, segments[0])
+        info['offset_s'] = round(at - segments[0]['start'], 1)
+        return jsonify({'status': 'success', 'segment': info})
+
+    segments = recording_store.query(camera_id, start, end)
+    return jsonify({
+        'status': 'success',
+        'camera_id': camera_id,
+        'segments': [segment_info(camera_id, segment) for segment in segments],
+        'count': len(segments)
+    })
+
+@app.route('/recordings/<camera_id>/segments/<filename>', methods=['GET'])
+def get_recording_segment(camera_id, filename):
+    """Serve a recorded segment; supports Range requests for seeking"""
+    segment = recording_store.find(camera_id, filename)
+    if not segment:
+        return jsonify({'status': 'error', 'message': 'Segment not found'}), 404
+    return send_file(segment['path'], mimetype='video/mp4', conditional=True)
+
+# Snapshot thumbnails
+#
+# Polling dashboards read these instead of /capture_frame: one background thread
+# refreshes a small JPEG per open camera, and responses carry ETags so an unchanged
+# poll is answered with 304.
+
+class SnapshotService:
+    """Keeps a small, periodically refreshed JPEG per open camera stream"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshots: Dict[str, dict] = {}  # camera id -> {'jpeg', 'image', 'etag', 'updated'}
+        self.subscribers: Dict[str, FrameSubscriber] = {}
+        # Same overlay as default thumb viewers, so both hit one cached encode per frame
+        self.overlay = draw_stream_overlay if STREAM_PROFILES['thumb']['overlay'] else None
+        self.thread = None
+
+    def ensure_running(self):
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        logger.info("🖼️ Snapshot service started")
+        while True:
+            started = time.time()
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"❌ Snapshot refresh error: {e}")
+            time.sleep(max(0.0, SNAPSHOT_INTERVAL - (time.time() - started)))
+
+    def refresh(self):
+        """Take the newest frame from each open stream; cameras never get opened here"""
+        streams = dict(camera_manager.streams)
+        for camera_id, stream in streams.items():
+            subscriber = self.subscribers.get(camera_id)
+            if subscriber is None or subscriber.closed or subscriber.stream is not stream:
+                # Capped at twice the refresh rate so each tick finds a fresh frame
+                subscriber = stream.subscribe('snapshots', 2.0 / SNAPSHOT_INTERVAL)
+                self.subscribers[camera_id] = subscriber
+
+            seq, frame = subscriber.get(timeout=0)
+            if frame is None:
+                continue
+            jpeg = stream.get_jpeg(seq, frame, SNAPSHOT_QUALITY, self.overlay, SNAPSHOT_WIDTH)
+            if not jpeg:
+                continue
+            # Content-derived, so an unchanged image keeps its ETag (and survives stream restarts)
+            etag = hashlib.md5(jpeg).hexdigest()[:16]
+            current = self.get(camera_id)
+            if current and current['etag'] == etag:
+                continue
+            snapshot = {
+                'jpeg': jpeg,
+                'image': base64.b64encode(jpeg).decode(),
+                'etag': etag,
+                'updated': datetime.now().isoformat()
+            }
+            with self.lock:
+                self.snapshots[camera_id] = snapshot
+
+        # Forget cameras that were released
+        for camera_id in list(self.subscribers):
+            if camera_id not in streams:
+                self.subscribers.pop(camera_id).close()
+                with self.lock:
+                    self.snapshots.pop(camera_id, None)
+
+    def get(self, camera_id: str) -> dict:
+        with self.lock:
+            return self.snapshots.get(camera_id)
+
+    def all(self, camera_ids: List[str] = None) -> Dict[str, dict]:
+        with self.lock:
+            if camera_ids is None:
+                return dict(self.snapshots)
+            return {camera_id: self.snapshots[camera_id] for camera_id in camera_ids if camera_id in self.snapshots}
+
+snapshot_service = SnapshotService()
+
+@app.route('/snapshots', methods=['GET'])
+def get_snapshots():
+    """Latest thumbnail of every open camera (or ?cameras=1,2) as base64 JSON, with an ETag"""
+    snapshot_service.ensure_running()
+    camera_ids = request.args.get('cameras')
+    camera_ids = [c.strip() for c in camera_ids.split(',') if c.strip()] if camera_ids else None
+    snapshots = snapshot_service.all(camera_ids)
+
+    # The bulk ETag changes whenever any included snapshot does
+    etag = hashlib.md5(','.join(sorted(s['etag'] for s in snapshots.values())).encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers={'ETag': f'"{etag}"'})
+
+    response = jsonify({
+        'status': 'success',
+        'width': SNAPSHOT_WIDTH,
+        'snapshots': {
+            camera_id: {'image': snapshot['image'], 'etag': snapshot['etag'], 'updated': snapshot['updated']}
+            for camera_id, snapshot in snapshots.items()
+        },
+        'count': len(snapshots)
+    })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/snapshots/<camera_id>', methods=['GET'])
+def get_camera_snapshot(camera_id):
+    """Latest thumbnail of one camera as a JPEG, with an ETag"""
+    snapshot_service.ensure_running()
+    snapshot = snapshot_service.get(camera_id)
+    if not snapshot:
+        return jsonify({'error': f'No snapshot for camera {camera_id}'}), 404
+    response = Response(snapshot['jpeg'], mimetype='image/jpeg')
+    response.set_etag(snapshot['etag'])
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+# WebSocket frame push
+#
+# /ws/video/<camera_id> sends one binary message per frame:
+#   WS_FRAME_HEADER (seq, capture time, detections length) + detections JSON + JPEG
+# The client answers {"ack": seq} once a frame is shown, which returns one credit,
+# and may grant more with {"credit": n}. Frames are only sent while the viewer has
+# credit, so a slow link gets fewer, fresher frames instead of a growing socket buffer.
+
+# Threaded mode needs the flask-sock package for this route; async mode serves it from Starlette
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
+
+WS_FRAME_HEADER = struct.Struct('!QdI')
+WS_INITIAL_CREDITS = 2
+WS_MAX_CREDITS = 30
+WS_CREDIT_TIMEOUT = 5.0  # Seconds without credit before one frame is sent anyway
+
+class WebSocketFlowControl:
+    """Credit accounting and round-trip latency for one WebSocket viewer"""
+
+    def __init__(self, credits: int = WS_INITIAL_CREDITS):
+        self.credits = credits
+        self.sent_at: Dict[int, float] = {}  # seq -> send time, until acked
+        self.last_sent = time.time()
+        self.round_trips = deque(maxlen=30)
+        self.sent = 0
+        self.acked = 0
+
+    def handle_message(self, message) -> dict:
+        """Apply a client control message; returns a reply for the client, if any"""
+        try:
+            data = json.loads(message)
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(data, dict):
+            return None
+        if 'ack' in data:
+            sent_at = self.sent_at.pop(data['ack'], None)
+            if sent_at is not None:
+                self.round_trips.append(time.time() - sent_at)
+                self.acked += 1
+                self.credits = min(WS_MAX_CREDITS, self.credits + 1)
+        if 'credit' in data:
+            try:
+                self.credits = min(WS_MAX_CREDITS, self.credits + max(0, int(data['credit'])))
+            except (TypeError, ValueError):
+                pass
+        if data.get('type') == 'stats':
+            return {'type': 'stats', **self.stats()}
+        return None
+
+    def can_send(self) -> bool:
+        # A viewer that stopped acking still gets an occasional frame rather than a frozen feed
+        return self.credits > 0 or time.time() - self.last_sent > WS_CREDIT_TIMEOUT
+
+    def on_sent(self, seq: int):
+        self.credits = max(0, self.credits - 1)
+        self.sent += 1
+        self.last_sent = time.time()
+        self.sent_at[seq] = self.last_sent
+        if len(self.sent_at) > 2 * WS_MAX_CREDITS:
+            self.sent_at.pop(next(iter(self.sent_at)))  # Never acked
+
+    def stats(self) -> dict:
+        rtt = sum(self.round_trips) / len(self.round_trips) if self.round_trips else None
+        return {
+            'credits': self.credits,
+            'sent': self.sent,
+            'acked': self.acked,
+            'avg_round_trip_ms': round(rtt * 1000, 1) if rtt is not None else None
+        }
+
+def ws_hello(camera_id: str, profile: str) -> str:
+    return json.dumps({
+        'type': 'hello',
+        'camera_id': camera_id,
+        'profile': profile,
+        'header': {'format': WS_FRAME_HEADER.format, 'fields': ['seq', 'capture_time', 'detections_length']},
+        'credits': WS_INITIAL_CREDITS
+    })
+
+def build_ws_frame(stream: CameraStream, seq: int, jpeg: bytes) -> bytes:
+    """Binary WebSocket message for one frame"""
+    detections = json.dumps(latest_detections.get(stream.camera_id, {}), default=str).encode()
+    return WS_FRAME_HEADER.pack(seq, stream.capture_time(seq), len(detections)) + detections + jpeg
+
+if Sock:
+    sock = Sock(app)
+
+    @sock.route('/ws/video/<camera_id>')
+    def ws_video_feed(ws, camera_id):
+        """WebSocket push of binary frames with credit-based flow control"""
+        profile = request.args.get('profile', DEFAULT_STREAM_PROFILE)
+        rtsp_url = get_rtsp_url(camera_id)
+        if profile_error(profile) or not rtsp_url:
+            ws.send(json.dumps({'type': 'error', **(profile_error(profile) or {'error': 'Camera not found'})}))
+            return
+        stream = camera_manager.get_stream(camera_id, rtsp_url)
+        if not stream:
+            ws.send(json.dumps({'type': 'error', 'error': 'Failed to initialize camera'}))
+            return
+
+        settings = STREAM_PROFILES[profile]
+        draw_overlay = draw_stream_overlay if parse_overlay_arg(request.args.get('overlay'), profile) else None
+        client = f"ws:{request.remote_addr}:{profile}"
+        subscriber = stream.subscribe(client, settings['fps'])
+        flow = WebSocketFlowControl()
+        logger.info(f"🔌 WebSocket viewer connected to camera {camera_id} ({client})")
+
+        try:
+            ws.send(ws_hello(camera_id, profile))
+            while True:
+                # Drain control messages; only block on them while the viewer has no credit
+                message = ws.receive(timeout=0 if flow.can_send() else 1.0)
+                while message is not None:
+                    reply = flow.handle_message(message)
+                    if reply:
+                        ws.send(json.dumps(reply))
+                    message = ws.receive(timeout=0)
+                if not flow.can_send():
+                    continue
+
+                seq, frame = subscriber.get(timeout=1.0)
+                if frame is None:
+                    if subscriber.closed:
+                        stream = camera_manager.find_stream(camera_id)
+                        if not stream:
+                            break
+                        subscriber = stream.subscribe(client, settings['fps'])
+                    else:
+                        ws.send(json.dumps({'type': 'status', 'state': stream.state}))
+                    continue
+
+                jpeg = stream.get_jpeg(seq, frame, settings['quality'], draw_overlay, settings['width'])
+                if jpeg:
+                    ws.send(build_ws_frame(stream, seq, jpeg))
+                    flow.on_sent(seq)
+        except Exception as e:
+            logger.info(f"🔌 WebSocket viewer left camera {camera_id}: {e}")
+        finally:
+            subscriber.stream.unsubscribe(subscriber)
+            logger.info(f"🛑 WebSocket feed ended for camera {camera_id} ({client}): {flow.stats()}")
+
+# Async streaming server mode
+#
+# With STREAM_SERVER_MODE=async the streaming routes are served from an asyncio
+# event loop (Starlette + uvicorn), so an idle viewer costs a coroutine rather than
+# a worker thread. Every other route is still handled by the Flask app, mounted as
+# WSGI behind the same server, so all URLs stay the same.
+
+class AsyncFrameSubscriber(FrameSubscriber):
+    """FrameSubscriber whose consumer is a coroutine on an asyncio event loop"""
+
+    def __init__(self, stream: CameraStream, name: str, max_fps: float, loop):
+        super().__init__(stream, name, max_fps)
+        self.loop = loop
+        self.ready = asyncio.Event()
+
+    def put(self, seq: int, frame) -> bool:
+        accepted = super().put(seq, frame)
+        if accepted:
+            self._wake()
+        return accepted
+
+    def close(self):
+        super().close()
+        self._wake()
+
+    def _wake(self):
+        try:
+            self.loop.call_soon_threadsafe(self.ready.set)
+        except RuntimeError:
+            pass  # Event loop already closed
+
+    async def get_async(self, timeout: float = 1.0):
+        """Next frame as (seq, frame); (None, None) only after timeout or once closed"""
+        deadline = self.loop.time() + timeout
+        while True:
+            try:
+                await asyncio.wait_for(self.ready.wait(), max(0.0, deadline - self.loop.time()))
+            except asyncio.TimeoutError:
+                return None, None
+            self.ready.clear()
+            seq, frame = self.get(timeout=0)
+            if frame is not None or self.closed:
+                return seq, frame
+            # A wake whose frame an earlier get already took: keep waiting for the next one
+
+# Camera opens block for up to CAMERA_OPEN_TIMEOUT; they get their own threads so a dead
+# camera cannot occupy the default executor that every viewer's JPEG encodes run on
+CAMERA_OPEN_WORKERS = int(os.getenv("CAMERA_OPEN_WORKERS", "8"))
+camera_open_executor = ThreadPoolExecutor(max_workers=CAMERA_OPEN_WORKERS, thread_name_prefix='camera-open')
+
+async def get_stream_async(camera_id: str, rtsp_url) -> CameraStream:
+    """camera_manager.get_stream from the event loop; viewers of a camera that is already being
+    opened await that open instead of each holding a thread for it"""
+    opening = camera_manager.pending_open(camera_id)
+    if opening is not None:
+        return await asyncio.wrap_future(opening)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(camera_open_executor, camera_manager.get_stream, camera_id, rtsp_url)
+
+async def generate_frames_async(camera_id: str, rtsp_url, client: str = 'mjpeg',
+                                profile: str = DEFAULT_STREAM_PROFILE, overlay: bool = None):
+    """Async counterpart of generate_frames, fed from the same shared stream"""
+    loop = asyncio.get_running_loop()
+    adaptive = AdaptiveQualityController() if profile == ADAPTIVE_PROFILE else None
+    settings = STREAM_PROFILES[adaptive.profile if adaptive else profile]
+    if overlay is None:
+        overlay = settings['overlay']
+    draw_overlay = draw_stream_overlay if overlay else None
+    client = f"{client}:{profile}"
+
+    stream = await get_stream_async(camera_id, rtsp_url)
+    if not stream:
+        logger.error(f"❌ Cannot generate frames for camera {camera_id} - camera not available")
+        return
+
+    subscriber = stream.attach(AsyncFrameSubscriber(stream, client, settings['fps'], loop))
+    subscriber.adaptive = adaptive
+    logger.info(f"🎬 Starting async frame generation for camera {camera_id} ({client})")
+
+    try:
+        while True:
+            seq, frame = await subscriber.get_async(timeout=1.0)
+
+            if frame is None:
+                if subscriber.closed:
+                    # Follow a restarted stream, or stop once the camera has given up
+                    stream = camera_manager.find_stream(camera_id)
+                    if not stream:
+                        logger.error(f"❌ Stream for camera {camera_id} stopped, ending feed")
+                        break
+                    subscriber = stream.attach(AsyncFrameSubscriber(stream, client, settings['fps'], loop))
+                    subscriber.adaptive = adaptive
+                    continue
+                frame_bytes = await loop.run_in_executor(None, stream.offline_jpeg, settings['quality'], settings['width'])
+                if not frame_bytes:
+                    frame_bytes = await loop.run_in_executor(None, encode_error_frame, camera_id,
+                                                             adaptive.profile if adaptive else profile)
+            else:
+                # Most viewers hit the shared cache; only a miss pays for an encode off the loop
+                frame_bytes = stream.cached_jpeg(seq, settings['quality'], draw_overlay, settings['width'])
+                if frame_bytes is None:
+                    frame_bytes = await loop.run_in_executor(
+                        None, stream.get_jpeg, seq, frame, settings['quality'],
+                        draw_overlay, settings['width'])
+
+            if not frame_bytes:
+                continue
+            part = mjpeg_part(frame_bytes)
+            sent_at = loop.time()
+            yield part
+
+            if adaptive and frame is not None:
+                if adaptive.record(len(part), loop.time() - sent_at, time.time() - subscriber.frame_time):
+                    settings = STREAM_PROFILES[adaptive.profile]
+                    subscriber.set_max_fps(settings['fps'])
+                    logger.info(f"📶 {client} on camera {camera_id} moved to {adaptive.profile}: {adaptive.stats()}")
+    finally:
+        subscriber.stream.unsubscribe(subscriber)
+        logger.info(f"🛑 Async frame generation ended for camera {camera_id} ({client}): {subscriber.stats()}")
+
+async def generate_grid_frames_async(camera_ids: List[str], profile: str = 'thumb'):
+    """Async counterpart of generate_grid_frames"""
+    loop = asyncio.get_running_loop()
+    settings = STREAM_PROFILES[profile]
+    composer = create_grid_composer(camera_ids, profile)
+    interval = 1.0 / settings['fps']
+    subscribers = await loop.run_in_executor(camera_open_executor, open_grid_subscribers, camera_ids, profile)
+
+    try:
+        while True:
+            tick_start = loop.time()
+            frame_bytes = await loop.run_in_executor(None, render_grid_tick, composer, subscribers, profile)
+            if frame_bytes:
+                yield mjpeg_part(frame_bytes)
+            await asyncio.sleep(max(0.0, interval - (loop.time() - tick_start)))
+    finally:
+        close_grid_subscribers(subscribers)
+
+async def generate_simple_frames_async(client: str):
+    """Async counterpart of generate_simple_frames; the webcam is shared like any camera"""
+    loop = asyncio.get_running_loop()
+    stream = await get_stream_async(SIMPLE_FEED_CAMERA_ID, 0)
+    if stream:
+        async for part in generate_frames_async(SIMPLE_FEED_CAMERA_ID, 0, client):
+            yield part
+        return
+
+    while True:
+        frame_bytes = await loop.run_in_executor(None, encode_test_pattern_frame)
+        if frame_bytes:
+            yield mjpeg_part(frame_bytes)
+        await asyncio.sleep(0.1)  # 10 FPS
+
+async def push_ws_frames_async(websocket, camera_id: str, rtsp_url, client: str,
+                               profile: str = DEFAULT_STREAM_PROFILE, overlay: bool = None):
+    """Async counterpart of ws_video_feed for an accepted Starlette WebSocket"""
+    loop = asyncio.get_running_loop()
+    settings = STREAM_PROFILES[profile]
+    if overlay is None:
+        overlay = settings['overlay']
+    draw_overlay = draw_stream_overlay if overlay else None
+
+    stream = await get_stream_async(camera_id, rtsp_url)
+    if not stream:
+        await websocket.send_text(json.dumps({'type': 'error', 'error': 'Failed to initialize camera'}))
+        return
+
+    subscriber = stream.attach(AsyncFrameSubscriber(stream, client, settings['fps'], loop))
+    flow = WebSocketFlowControl()
+    credit = asyncio.Event()
+
+    async def receive_control():
+        while True:
+            reply = flow.handle_message(await websocket.receive_text())
+            if reply:
+                await websocket.send_text(json.dumps(reply))
+            if flow.can_send():
+                credit.set()
+
+    receiver = asyncio.create_task(receive_control())
+    logger.info(f"🔌 WebSocket viewer connected to camera {camera_id} ({client})")
+    try:
+        await websocket.send_text(ws_hello(camera_id, profile))
+        while not receiver.done():
+            if not flow.can_send():
+                credit.clear()
+                try:
+                    await asyncio.wait_for(credit.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            seq, frame = await subscriber.get_async(timeout=1.0)
+            if frame is None:
+                if subscriber.closed:
+                    stream = camera_manager.find_stream(camera_id)
+                    if not stream:
+                        break
+                    subscriber = stream.attach(AsyncFrameSubscriber(stream, client, settings['fps'], loop))
+                else:
+                    await websocket.send_text(json.dumps({'type': 'status', 'state': stream.state}))
+                continue
+
+            jpeg = stream.cached_jpeg(seq, settings['quality'], draw_overlay, settings['width'])
+            if jpeg is None:
+                jpeg = await loop.run_in_executor(None, stream.get_jpeg, seq, frame, settings['quality'],
+                                                  draw_overlay, settings['width'])
+            if jpeg:
+                await websocket.send_bytes(build_ws_frame(stream, seq, jpeg))
+                flow.on_sent(seq)
+    except Exception as e:
+        logger.info(f"🔌 WebSocket viewer left camera {camera_id}: {e}")
+    finally:
+        receiver.cancel()
+        subscriber.stream.unsubscribe(subscriber)
+        logger.info(f"🛑 WebSocket feed ended for camera {camera_id} ({client}): {flow.stats()}")
+
+async def generate_events_async(last_id: int):
+    """Async counterpart of the /api/events/stream generator, woken by add_event"""
+    listener = (asyncio.get_running_loop(), asyncio.Event())
+    with events_lock:
+        event_listeners.add(listener)
+    try:
+        while True:
+            # Cleared before reading so an event added in between still wakes the wait below
+            listener[1].clear()
+            new_events = get_events_after(last_id)
+            if new_events:
+                for event in new_events:
+                    yield format_sse_event(event)
+                last_id = new_events[-1]['id']
+                continue
+            try:
+                await asyncio.wait_for(listener[1].wait(), 15)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+    finally:
+        with events_lock:
+            event_listeners.discard(listener)
+
+def create_async_app():
+    """ASGI app serving the streaming routes natively and everything else through Flask"""
+    from starlette.applications import Starlette
+    from starlette.concurrency import run_in_threadpool
+    from starlette.responses import JSONResponse, StreamingResponse
+    from starlette.routing import Mount, Route, WebSocketRoute
+    try:
+        from a2wsgi import WSGIMiddleware
+    except ImportError:
+        from starlette.middleware.wsgi import WSGIMiddleware
+
+    stream_headers = {
+        'Access-Control-Allow-Origin': '*',
+        'Cache-Control': 'no-cache, no-store, must-revalidate',
+        'Pragma': 'no-cache',
+        'Expires': '0'
+    }
+
+    def mjpeg_response(parts):
+        return StreamingResponse(parts, media_type='multipart/x-mixed-replace; boundary=frame',
+                                 headers=stream_headers)
+
+    async def video_feed_endpoint(request):
+        camera_id = request.path_params['camera_id']
+        profile = request.query_params.get('profile', DEFAULT_STREAM_PROFILE)
+        if profile_error(profile, allow_adaptive=True):
+            return JSONResponse(profile_error(profile, allow_adaptive=True), status_code=400)
+
+        rtsp_url = await run_in_threadpool(get_rtsp_url, camera_id)
+        if not rtsp_url:
+            return JSONResponse({'error': 'Camera not found'}, status_code=404)
+
+        overlay = parse_overlay_arg(request.query_params.get('overlay'), profile)
+        client = f"mjpeg-async:{request.client.host if request.client else 'unknown'}"
+        return mjpeg_response(generate_frames_async(camera_id, rtsp_url, client, profile, overlay))
+
+    async def video_feed_grid_endpoint(request):
+        camera_ids, error = parse_grid_cameras(request.query_params.get('cameras'))
+        if error:
+            return JSONResponse({'error': error}, status_code=400)
+        profile = request.query_params.get('profile', 'thumb')
+        if profile_error(profile):
+            return JSONResponse(profile_error(profile), status_code=400)
+        return mjpeg_response(generate_grid_frames_async(camera_ids, profile))
+
+    async def video_feed_simple_endpoint(request):
+        client = f"simple-async:{request.client.host if request.client else 'unknown'}"
+        return mjpeg_response(generate_simple_frames_async(client))
+
+    async def ws_video_feed_endpoint(websocket):
+        camera_id = websocket.path_params['camera_id']
+        profile = websocket.query_params.get('profile', DEFAULT_STREAM_PROFILE)
+        rtsp_url = await run_in_threadpool(get_rtsp_url, camera_id)
+        await websocket.accept()
+        if profile_error(profile) or not rtsp_url:
+            await websocket.send_text(json.dumps({'type': 'error', **(profile_error(profile) or {'error': 'Camera not found'})}))
+            await websocket.close()
+            return
+
+        overlay = parse_overlay_arg(websocket.query_params.get('overlay'), profile)
+        client = f"ws-async:{websocket.client.host if websocket.client else 'unknown'}:{profile}"
+        await push_ws_frames_async(websocket, camera_id, rtsp_url, client, profile, overlay)
+
+    async def events_stream_endpoint(request):
+        last_id = request.query_params.get('since')
+        if last_id is None or not last_id.isdigit():
+            with events_lock:
+                last_id = recent_events[-1]['id'] if recent_events else 0
+        return StreamingResponse(generate_events_async(int(last_id)), media_type='text/event-stream',
+                                 headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no',
+                                          'Access-Control-Allow-Origin': '*'})
+
+    return Starlette(routes=[
+        Route('/video_feed/grid', video_feed_grid_endpoint),
+        Route('/video_feed/{camera_id}', video_feed_endpoint),
+        Route('/video_feed_simple', video_feed_simple_endpoint),
+        Route('/api/events/stream', events_stream_endpoint),
+        WebSocketRoute('/ws/video/{camera_id}', ws_video_feed_endpoint),
+        Mount('/', app=WSGIMiddleware(app)),
+    ])
+
+def run_async_server(host: str, port: int):
+    try:
+        import uvicorn
+        asgi_app = create_async_app()
+    except ImportError as e:
+        logger.error(f"❌ Async streaming mode requires starlette and uvicorn: {e}")
+        raise
+
+    logger.info("⚡ Serving streaming routes from the asyncio event loop")
+    uvicorn.run(asgi_app, host=host, port=port, log_level="info")
+
 if __name__ == '__main__':
     logger.info("🚀 Starting Safety Surveillance Camera Server")
     logger.info(f"📡 Backend API URL: {BACKEND_API_URL}")
@@ -1899,4 +5327,17 @@ if __name__ == '__main__':
     else:
         logger.warning("⚠️ No webcam detected")
     
-    app.run(host='0.0.0.0', port=8000, debug=False, threaded=True)
\ No newline at end of file
+    # Indexing also removes interrupted .part.mp4 files, so only the server itself does it
+    recording_store.load()
+    clip_store.load()
+    for camera_id in filter(None, os.getenv("RECORD_CAMERAS", "").split(',')):
+        start_recording(camera_id.strip())
+    snapshot_service.ensure_running()
+    
+    if os.getenv("STREAM_SERVER_MODE", "threaded").lower() == "async":
+        run_async_server(host='0.0.0.0', port=8000)
+    else:
+        if Sock is None:
+            logger.warning("⚠️ flask-sock is not installed: /ws/video/<camera_id> is unavailable "
+                           "in threaded mode (pip install flask-sock)")
+        app.run(host='0.0.0.0', port=8000, debug=False, threaded=True)
\ No newline at end of file
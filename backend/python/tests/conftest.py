@@ -0,0 +1,27 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+SERVER_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'camera-server.py')
+
+
+@pytest.fixture(scope='session')
+def server():
+    """camera-server.py as a module (the dash in its name rules out a plain import)"""
+    module = sys.modules.get('camera_server')
+    if module is None:
+        spec = importlib.util.spec_from_file_location('camera_server', SERVER_PATH)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules['camera_server'] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def clock(server, monkeypatch):
+    """Controllable time.time(); advance with clock[0] += seconds"""
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(server.time, 'time', lambda: now[0])
+    return now
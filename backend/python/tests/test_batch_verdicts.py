@@ -0,0 +1,27 @@
+import pytest
+
+
+def test_parses_array_inside_surrounding_text(server):
+    reply = 'Here are the verdicts:\n```json\n[" Fire detected ", "No fire"]\n```'
+
+    assert server.parse_batch_verdicts(reply, 2) == ['Fire detected', 'No fire']
+
+
+def test_non_string_verdicts_are_stringified(server):
+    assert server.parse_batch_verdicts('[1, true]', 2) == ['1', 'True']
+
+
+@pytest.mark.parametrize('reply', [
+    'No fire in any image',
+    '] backwards [',
+    '["unterminated", ]',
+    '["only one"]',
+    '["one", "two", "three"]',
+])
+def test_rejects_replies_without_one_answer_per_image(server, reply):
+    with pytest.raises(server.BatchReplyError):
+        server.parse_batch_verdicts(reply, 2)
+
+
+def test_batch_reply_error_is_a_value_error(server):
+    assert issubclass(server.BatchReplyError, ValueError)
@@ -0,0 +1,70 @@
+import pytest
+
+
+@pytest.fixture
+def breaker(server, clock, monkeypatch):
+    monkeypatch.setattr(server, 'BREAKER_FAILURE_THRESHOLD', 3)
+    monkeypatch.setattr(server, 'BREAKER_OPEN_SECONDS', 30)
+    monkeypatch.setattr(server, 'BREAKER_MAX_OPEN_SECONDS', 100)
+    return server.CircuitBreaker('fire')
+
+
+def trip(breaker):
+    for admitted in [breaker.allow() for _ in range(3)]:
+        breaker.record_failure(RuntimeError('down'), admitted)
+
+
+def test_opens_after_consecutive_failures(breaker):
+    admitted = breaker.allow()
+    breaker.record_failure(RuntimeError('down'), admitted)
+    breaker.record_success(breaker.allow())  # A success resets the count
+    assert breaker.state == 'closed'
+
+    trip(breaker)
+    assert breaker.state == 'open'
+    assert breaker.allow() is None
+    assert breaker.stats()['short_circuited'] == 1
+
+
+def test_single_probe_after_open_period(breaker, clock):
+    trip(breaker)
+    clock[0] += 30
+
+    assert breaker.allow() == 'probe'
+    assert breaker.allow() is None  # Only one probe at a time
+
+    breaker.record_success('probe')
+    assert breaker.state == 'closed'
+    assert breaker.allow() == 'closed'
+
+
+def test_failed_probe_backs_off(breaker, clock):
+    trip(breaker)
+    for expected in (60, 100, 100):
+        clock[0] += breaker.open_seconds
+        breaker.record_failure(RuntimeError('still down'), breaker.allow())
+        assert breaker.state == 'open'
+        assert breaker.open_seconds == expected
+
+
+def test_stragglers_do_not_move_an_open_breaker(breaker, clock):
+    stragglers = [breaker.allow() for _ in range(5)]  # In flight when the endpoint goes down
+    for admitted in stragglers[:3]:
+        breaker.record_failure(RuntimeError('down'), admitted)
+    opened_at = breaker.opened_at
+
+    clock[0] += 10
+    for admitted in stragglers[3:]:
+        breaker.record_failure(RuntimeError('late'), admitted)
+    assert breaker.trips == 1
+    assert breaker.opened_at == opened_at
+
+    breaker.record_success(stragglers[0])
+    assert breaker.state == 'open'
+
+    clock[0] += 20
+    probe = breaker.allow()
+    breaker.record_success('closed')  # A straggler answering during the probe
+    assert breaker.state == 'half-open'
+    breaker.record_success(probe)
+    assert breaker.state == 'closed'
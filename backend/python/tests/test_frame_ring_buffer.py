@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+
+def frame(value, shape=(4, 6, 3)):
+    return np.full(shape, value, dtype=np.uint8)
+
+
+@pytest.fixture
+def ring(server):
+    ring = server.FrameRingBuffer(seconds=2, fps=2)  # 4 slots
+    ring.acquire()
+    return ring
+
+
+def fill(ring, count, start=100.0):
+    for seq in range(count):
+        ring.put(seq, frame(seq), start + seq * 0.5)
+
+
+def test_keeps_nothing_without_users(server):
+    ring = server.FrameRingBuffer(seconds=2, fps=2)
+    ring.put(0, frame(0), 100.0)
+
+    assert not ring.active
+    assert ring.frames is None
+    assert ring.get(0) is None
+
+
+def test_put_is_throttled_to_fps(server):
+    ring = server.FrameRingBuffer(seconds=20, fps=2)
+    ring.acquire()
+    for seq in range(100):
+        ring.put(seq, frame(seq), 100.0 + seq * 0.1)  # 10 s at 10 fps offered
+
+    timestamps = [ts for _, ts in ring.index(0)]
+    mean_interval = (timestamps[-1] - timestamps[0]) / (len(timestamps) - 1)
+    assert mean_interval == pytest.approx(0.5, abs=0.05)
+
+
+def test_overwrites_oldest_when_full(ring):
+    fill(ring, 6)
+
+    assert [seq for seq, _ in ring.index(0)] == [2, 3, 4, 5]
+    assert ring.get(1) is None
+    assert ring.get(4)[0, 0, 0] == 4
+
+
+def test_frame_at_returns_closest_capture(ring):
+    fill(ring, 4)
+
+    seq, ts, image = ring.frame_at(101.1)
+    assert (seq, ts) == (2, 101.0)
+    assert image[0, 0, 0] == 2
+
+    image[:] = 255  # A copy, not a view into the ring
+    assert ring.get(2)[0, 0, 0] == 2
+
+
+def test_between_and_reused_buffer(ring):
+    fill(ring, 4)
+    out = np.empty((4, 4, 6, 3), dtype=np.uint8)
+
+    seqs, timestamps, frames = ring.between(100.5, 101.0, out=out)
+    assert seqs == [1, 2]
+    assert timestamps == [100.5, 101.0]
+    assert frames.shape[0] == 2
+    assert np.shares_memory(frames, out)
+    assert [int(f[0, 0, 0]) for f in frames] == [1, 2]
+
+
+def test_resolution_change_drops_older_frames(ring):
+    fill(ring, 2)
+    ring.put(9, frame(9, shape=(8, 8, 3)), 110.0)
+
+    assert [seq for seq, _ in ring.index(0)] == [9]
+    assert ring.get(9).shape == (8, 8, 3)
+
+
+def test_last_user_release_frees_frames(ring):
+    ring.acquire()
+    fill(ring, 2)
+
+    ring.release()
+    assert ring.get(1) is not None
+
+    ring.release()
+    assert ring.frames is None
+    assert ring.index(0) == []
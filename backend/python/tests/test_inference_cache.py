@@ -0,0 +1,66 @@
+import pytest
+
+HASH = 0xF0F0_F0F0_F0F0_F0F0
+
+
+@pytest.fixture
+def cache(server, clock):
+    return server.InferenceResultCache(ttl=30, max_entries=3, max_distance=4,
+                                       overrides={'fire': {'ttl': 5, 'max_distance': 0}})
+
+
+def test_exact_and_near_hits(cache):
+    cache.put('helmet', 'prompt', 'cam1', 'gemini', HASH, 'all wearing helmets')
+
+    assert cache.get('helmet', 'prompt', 'cam1', 'gemini', HASH) == 'all wearing helmets'
+    assert cache.get('helmet', 'prompt', 'cam1', 'gemini', HASH ^ 0b1111) == 'all wearing helmets'
+    assert cache.get('helmet', 'prompt', 'cam1', 'gemini', HASH ^ 0b11111) is None
+    assert cache.stats() == {'entries': 1, 'hits': 1, 'near_hits': 1, 'misses': 1, 'hit_ratio': 0.667}
+
+
+def test_near_hit_prefers_closest_hash(cache):
+    cache.put('helmet', 'prompt', 'cam1', 'gemini', HASH ^ 0b111, 'three bits off')
+    cache.put('helmet', 'prompt', 'cam1', 'gemini', HASH ^ 0b1, 'one bit off')
+
+    assert cache.get('helmet', 'prompt', 'cam1', 'gemini', HASH) == 'one bit off'
+
+
+@pytest.mark.parametrize('key', [
+    ('vest', 'prompt', 'cam1', 'gemini'),
+    ('helmet', 'other prompt', 'cam1', 'gemini'),
+    ('helmet', 'prompt', 'cam2', 'gemini'),
+    ('helmet', 'prompt', 'cam1', 'local:/models/helmet.gguf'),
+])
+def test_answers_are_not_shared_across_keys(cache, key):
+    cache.put('helmet', 'prompt', 'cam1', 'gemini', HASH, 'all wearing helmets')
+
+    assert cache.get(*key, HASH) is None
+
+
+def test_entries_expire(cache, clock):
+    cache.put('helmet', 'prompt', 'cam1', 'gemini', HASH, 'all wearing helmets')
+
+    clock[0] += 31
+    assert cache.get('helmet', 'prompt', 'cam1', 'gemini', HASH) is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_fire_override_is_exact_and_short_lived(cache, clock):
+    cache.put('fire', 'prompt', 'cam1', 'gemini', HASH, 'no fire')
+
+    assert cache.get('fire', 'prompt', 'cam1', 'gemini', HASH ^ 0b1) is None
+    assert cache.get('fire', 'prompt', 'cam1', 'gemini', HASH) == 'no fire'
+
+    clock[0] += 6
+    assert cache.get('fire', 'prompt', 'cam1', 'gemini', HASH) is None
+
+
+def test_evicts_least_recently_used(cache):
+    for camera_id in ('cam1', 'cam2', 'cam3'):
+        cache.put('helmet', 'prompt', camera_id, 'gemini', HASH, camera_id)
+    cache.get('helmet', 'prompt', 'cam1', 'gemini', HASH)  # cam2 is now the oldest
+
+    cache.put('helmet', 'prompt', 'cam4', 'gemini', HASH, 'cam4')
+
+    assert cache.get('helmet', 'prompt', 'cam2', 'gemini', HASH) is None
+    assert cache.get('helmet', 'prompt', 'cam1', 'gemini', HASH) == 'cam1'
@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+NOW = 1_700_000_000.0
+
+
+@pytest.fixture
+def store(server, clock, tmp_path):
+    clock[0] = NOW
+    return server.RecordingStore(root=str(tmp_path), retention_hours=1, quota_gb=1e-6)  # 1000 bytes
+
+
+def write_segment(store, camera_id, start, end, size=100):
+    path = store.segment_path(camera_id, start, end)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+    return {'start': start, 'end': end, 'path': path, 'bytes': size}
+
+
+def test_segment_path_rejects_unsafe_ids(store):
+    assert os.path.basename(store.segment_path('cam1', NOW)).endswith('.part.mp4')
+    for camera_id in ('../etc', 'a/b', '', 'x' * 65):
+        with pytest.raises(ValueError):
+            store.segment_path(camera_id, NOW)
+
+
+def test_load_indexes_finished_segments_and_drops_partial_ones(server, store):
+    write_segment(store, 'cam1', NOW - 60, NOW)
+    write_segment(store, 'cam1', NOW - 120, NOW - 60)
+    partial = store.segment_path('cam1', NOW)
+    with open(partial, 'wb') as f:
+        f.write(b'\0')
+
+    reloaded = server.RecordingStore(root=store.root, retention_hours=1, quota_gb=1e-6)
+    reloaded.load()
+
+    assert [s['start'] for s in reloaded.query('cam1')] == [NOW - 120, NOW - 60]
+    assert reloaded.total_bytes == 200
+    assert not os.path.exists(partial)
+
+
+def test_query_returns_overlapping_segments(store):
+    for i in range(3):
+        store.add('cam1', write_segment(store, 'cam1', NOW - 180 + i * 60, NOW - 120 + i * 60))
+
+    assert [s['start'] for s in store.query('cam1', NOW - 130, NOW - 110)] == [NOW - 180, NOW - 120]
+    assert store.query('cam2') == []
+
+    segment = store.query('cam1')[0]
+    assert store.find('cam1', os.path.basename(segment['path'])) == segment
+    assert store.find('cam1', 'missing.mp4') is None
+
+
+def test_retention_removes_old_segments(store):
+    old = write_segment(store, 'cam1', NOW - 7300, NOW - 7200)
+    store.add('cam1', old)
+
+    assert store.query('cam1') == []
+    assert not os.path.exists(old['path'])
+    assert store.stats()['evicted'] == 1
+
+
+def test_quota_evicts_globally_oldest_segment(store):
+    oldest = write_segment(store, 'cam2', NOW - 600, NOW - 540, size=400)
+    store.add('cam2', oldest)
+    store.add('cam1', write_segment(store, 'cam1', NOW - 300, NOW - 240, size=400))
+
+    store.add('cam1', write_segment(store, 'cam1', NOW - 60, NOW, size=400))
+
+    assert store.query('cam2') == []
+    assert not os.path.exists(oldest['path'])
+    assert len(store.query('cam1')) == 2
+    assert store.total_bytes == 800
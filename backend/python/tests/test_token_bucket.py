@@ -0,0 +1,17 @@
+def test_burst_then_refill(server, clock):
+    bucket = server.TokenBucket(rate=2.0, burst=3)
+
+    assert [bucket.try_take() for _ in range(4)] == [True, True, True, False]
+
+    clock[0] += 0.5  # One token at 2/s
+    assert bucket.try_take()
+    assert not bucket.try_take()
+
+
+def test_refill_is_capped_at_burst(server, clock):
+    bucket = server.TokenBucket(rate=10.0, burst=2)
+    bucket.try_take()
+    bucket.try_take()
+
+    clock[0] += 60
+    assert [bucket.try_take() for _ in range(3)] == [True, True, False]